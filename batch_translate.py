@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量翻译多本书
+所有书的段落共用一个线程池、一个 API 客户端（同一个限流预算）和一个译文缓存；
+每本书的进度自动恢复，不再询问，一本书翻译完成后立即生成它的EPUB
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import translate_md_to_epub as translator
+from dedup import DedupPlan
+from glossary import glossary_path
+from deepseek_client import TranslationError
+from md_stream import read_paragraphs
+from progress_journal import CheckpointWriter, remove_journal
+from run_report import RunStats
+from translation_cache import RefreshCache
+
+
+class BookJob:
+    """一本书的翻译状态"""
+
+    def __init__(self, input_md, output_epub, source_lang, title, chapter_level=None, epub_workers=None,
+                 epub_cache=True):
+        self.input_md = input_md
+        self.output_epub = output_epub
+        self.source_lang = source_lang
+        self.title = title
+        self.chapter_level = chapter_level or translator.DEFAULT_CHAPTER_LEVEL
+        self.epub_workers = epub_workers
+        self.epub_cache = epub_cache
+        self.name = os.path.basename(input_md)
+        self.progress_file = f"{os.path.splitext(input_md)[0]}_progress.jsonl"
+        self.paragraphs = []
+        self.translated = {}
+        self.journal = None
+        self.hashes = []
+        self.remaining_batches = 0
+        # 已交给 finish（由它写下最终检查点并生成EPUB）
+        self.finished = False
+        self.failed = []
+        self.plan = None
+        self.glossary = None
+        self.writer = None
+        # 进度文件中已有的质量标记和用户已接受的段落
+        self.flags = {}
+        self.accepted = set()
+        # 本次要重新翻译的被标记段落，成功之前 translated 中仍是原来的译文
+        self.retranslate = set()
+        self.batch_tokens = translator.DEFAULT_BATCH_TOKENS
+
+    def open(self, batch_tokens, dedup=None, stats=None, retranslate_flagged=False):
+        """读取段落并恢复已有进度，返回待翻译的批次
+
+        dedup 为相似度阈值时重复段落每组只翻译一段；retranslate_flagged 为 True 时
+        被质量检查标记的段落也重新翻译（逐段请求），新译文成功之前保留原来的译文。
+        """
+        self.paragraphs = list(read_paragraphs(self.input_md))
+        progress = translator.load_progress(self.progress_file)
+        self.translated = translator.resumable_translations(progress, self.paragraphs, self.source_lang)
+        self.flags, self.accepted = translator.resumed_quality(progress, self.translated)
+        self.retranslate = retranslate = set(self.flags) if retranslate_flagged else set()
+        if retranslate_flagged:
+            batch_tokens = 0
+        self.journal, self.hashes = translator.start_journal(
+            self.paragraphs, self.source_lang, self.progress_file, self.translated, self.flags, self.accepted)
+        self.writer = CheckpointWriter(self.journal)
+        pending = [i for i in range(len(self.paragraphs)) if i not in self.translated or i in retranslate]
+        self.batch_tokens = batch_tokens
+        if dedup is not None:
+            self.plan = DedupPlan(self.paragraphs, pending, dedup)
+            batches = translator.batch_paragraphs(self.paragraphs, self.plan.representatives, batch_tokens,
+                                                  self.plan.skipped())
+            if stats is not None and self.plan.duplicates:
+                stats.record_dedup(self.plan.duplicates,
+                                   len(translator.batch_paragraphs(self.paragraphs, pending, batch_tokens)) -
+                                   len(batches))
+        else:
+            batches = translator.batch_paragraphs(self.paragraphs, pending, batch_tokens)
+        self.remaining_batches = len(batches)
+        print(f"[{self.name}] 段落 {len(self.paragraphs)}，已完成 {len(self.translated) - len(retranslate)}，"
+              f"待翻译 {len(pending)} 段 / {len(batches)} 个请求" +
+              (f"，其中 {self.plan.duplicates} 段重复段落复用译文" if self.plan and self.plan.duplicates else "") +
+              (f"，其中 {len(retranslate)} 段是被标记的可疑译文" if retranslate else ""))
+        return batches
+
+    def record(self, batch, results):
+        """写入一个批次的译文，返回 (完成的段落数, 需要单独翻译的重复段落批次)"""
+        finished = list(zip(batch, results))
+        retry = []
+        if self.plan is not None:
+            for i, text in zip(batch, results):
+                resolved, unresolved = self.plan.fan_out(i, text)
+                finished.extend(resolved)
+                retry.extend(unresolved)
+        for i, text in finished:
+            self.translated[i] = text
+            self.writer.append(i, self.hashes[i], text)
+        return len(finished), translator.batch_paragraphs(self.paragraphs, sorted(retry), self.batch_tokens)
+
+    def fail(self, batch):
+        self.failed.extend(batch)
+        if self.plan is not None:
+            self.failed.extend(m for i in batch for m in self.plan.members.get(i, ()))
+
+    def finish(self, stats=None):
+        """检查译文质量并写入EPUB；全部段落都成功且没有可疑译文时删除进度文件"""
+        try:
+            flags = translator.flag_translations(self.paragraphs, self.translated, self.hashes, self.writer, stats,
+                                                 label=f"[{self.name}] ", previous=self.flags,
+                                                 accepted=self.accepted)
+        finally:
+            self.writer.close()
+        translated = (self.translated.get(i, p) for i, p in enumerate(self.paragraphs))
+        translator.md_to_epub(translated, self.output_epub, title=self.title,
+                              chapter_level=self.chapter_level, workers=self.epub_workers,
+                              use_cache=self.epub_cache)
+        if self.failed or flags:
+            print(f"[{self.name}] 有 {len(self.failed)} 段失败并保留了原文或之前的译文、{len(flags)} 段译文可疑，"
+                  f"保留进度文件: {self.progress_file}")
+        else:
+            remove_journal(self.progress_file)
+        print(f"[{self.name}] 完成，输出文件: {self.output_epub}")
+
+
+def load_jobs(source, source_lang, output_dir):
+    """从目录（其中所有 .md 文件）或 JSON 清单构建任务
+
+    清单格式：[{"input": "a.md", "output": "a.epub", "source_lang": "fr", "title": "..."}, ...]，
+    除 input 外均可省略；input 和 output 中的相对路径都相对于清单所在的目录。
+    """
+    if os.path.isdir(source):
+        entries = [{"input": os.path.join(source, name)}
+                   for name in sorted(os.listdir(source)) if name.endswith('.md')]
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(source))
+        for entry in entries:
+            entry["input"] = os.path.join(base_dir, entry["input"])
+            if "output" in entry:
+                entry["output"] = os.path.join(base_dir, entry["output"])
+
+    jobs = []
+    for entry in entries:
+        input_md = entry["input"]
+        base = os.path.splitext(os.path.basename(input_md))[0]
+        default_output = os.path.join(output_dir or os.path.dirname(input_md), f"{base}_translated.epub")
+        lang = entry.get("source_lang", source_lang)
+        if lang not in ["en", "fr"]:
+            print(f"跳过 {input_md}：source_lang 只支持 'en' 或 'fr'")
+            continue
+        jobs.append(BookJob(input_md, entry.get("output", default_output), lang, entry.get("title", base)))
+    return jobs
+
+
+def translate_books(jobs, api_key, client, cache, concurrency, batch_tokens, stats, dedup=None,
+                    glossary_min_count=None, retranslate_flagged=False):
+    """把所有书的批次放进同一个线程池；按书的顺序提交，前面的书先完成
+
+    glossary_min_count 不为 None 时每本书使用自己的术语表（<书名>_glossary.json）。
+    retranslate_flagged 为 True 时只重新翻译各书进度文件中被标记的段落和失败的段落，不从缓存取回旧译文。
+    返回没能生成EPUB的书。
+    """
+    if retranslate_flagged and cache is not None:
+        cache = RefreshCache(cache)
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    # EPUB 在单独的线程中生成，不阻塞翻译结果的处理
+    epub_executor = ThreadPoolExecutor(max_workers=1)
+    pending = []
+    futures = {}
+    # 每本书 finish 的 future，结束时检查有没有出错
+    finishing = []
+    total = done = 0
+    interrupted = False
+
+    def submit_finish(job):
+        job.finished = True
+        finishing.append((job, epub_executor.submit(job.finish, stats)))
+
+    translator.install_signal_handlers()
+    try:
+        for job in jobs:
+            batches = job.open(batch_tokens, dedup, stats, retranslate_flagged)
+            if glossary_min_count is not None and batches:
+                job.glossary = translator.prepare_glossary(job.paragraphs, job.source_lang,
+                                                           glossary_path(job.input_md), client, glossary_min_count)
+            total += len(job.paragraphs)
+            done += len(job.translated) - len(job.retranslate)
+            if not batches:
+                submit_finish(job)
+                continue
+            pending.extend((job, batch) for batch in batches)
+
+        stats.set_total(total, done)
+
+        def record(future, job, batch):
+            try:
+                count, retry = job.record(batch, future.result())
+                stats.record_paragraphs(count)
+                print(f"总进度: {stats.progress_line()} - [{job.name}] 第 {batch[0] + 1}-{batch[-1] + 1} 段完成")
+            except TranslationError as e:
+                job.fail(batch)
+                retry = []
+                print(f"[{job.name}] 第 {batch[0] + 1}-{batch[-1] + 1} 段翻译失败: {e}")
+            if retry:
+                stats.record_dedup(-sum(map(len, retry)), -len(retry), sum(map(len, retry)))
+                pending.extend((job, extra) for extra in retry)
+            job.remaining_batches += len(retry) - 1
+
+        # 去重时，数字无法对应到代表段落译文的重复段落在下一轮单独翻译
+        while pending:
+            futures = {executor.submit(translator.run_batch, [job.paragraphs[i] for i in batch],
+                                       api_key, job.source_lang, client, cache, stats, time.monotonic(),
+                                       job.glossary): (job, batch)
+                       for job, batch in pending}
+            pending = []
+            for future in as_completed(futures):
+                job, batch = futures[future]
+                record(future, job, batch)
+                del futures[future]
+                if job.remaining_batches == 0:
+                    submit_finish(job)
+    except KeyboardInterrupt:
+        # 中断后只记录进行中的请求，排队中的EPUB不再生成（正在生成的会完成）
+        interrupted = True
+        translator.drain(executor, futures, lambda future: record(future, *futures[future]))
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        # 为没有交给 finish 的书写下最终检查点（包括 drain 期间刚完成最后一批的书）
+        for job in jobs:
+            if job.writer is not None and not job.finished:
+                job.writer.close()
+        with stats.stage("epub"):
+            epub_executor.shutdown(wait=True, cancel_futures=interrupted)
+        for job, future in finishing:
+            if future.cancelled():
+                # finish 没有运行，由这里关闭进度日志
+                job.writer.close()
+            elif future.exception() is not None:
+                # finish 中的异常（写EPUB、写进度文件失败等）不能静默丢失，逐本报告
+                print(f"[{job.name}] 生成EPUB失败: {future.exception()}")
+    return [job for job, future in finishing if not future.cancelled() and future.exception() is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量翻译多本Markdown书籍，共用线程池和限流预算")
+    parser.add_argument("source", help="包含 .md 文件的目录，或 JSON 清单文件")
+    parser.add_argument("--source-lang", default="en", help="默认源语言 en/fr (默认: en)")
+    parser.add_argument("--output-dir", help="EPUB输出目录 (默认: 与每本书相同的目录)")
+    parser.add_argument("--api-key", help="DeepSeek API密钥 (默认读取环境变量 DEEPSEEK_API_KEY)")
+    translator.add_translation_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"错误：{args.source} 不存在")
+        sys.exit(1)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    api_key = translator.resolve_api_key(args.api_key)
+    jobs = load_jobs(args.source, args.source_lang, args.output_dir)
+    for job in jobs:
+        job.chapter_level = args.chapter_level
+        job.epub_workers = args.epub_workers
+        job.epub_cache = not args.no_epub_cache
+    print(f"共 {len(jobs)} 本书，全局并发数 {args.concurrency}，限流 {args.rate_limit} 次/秒")
+
+    stats = RunStats()
+    client = translator.create_client(args, api_key, stats)
+    cache = translator.open_cache(args)
+    failed_books = []
+    try:
+        with stats.stage("translate"):
+            failed_books = translate_books(jobs, api_key, client, cache, args.concurrency, args.batch_tokens,
+                                           stats, translator.dedup_threshold(args),
+                                           args.glossary_min_count if args.glossary else None,
+                                           args.retranslate_flagged)
+    except KeyboardInterrupt:
+        print("\n用户中断程序，各书进度已保存，重新运行即可继续")
+    finally:
+        client.close()
+        translator.close_cache(cache)
+        translator.finish_report(stats, args.report)
+    if failed_books:
+        print(f"{len(failed_books)} 本书没有生成EPUB: {', '.join(job.name for job in failed_books)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+清理性能基准
+生成合成的 Markdown 文件，对比旧版多遍 re.sub 清理与 clean_md.py 的单遍流水线，
+并检查两者输出逐字节一致
+
+用法：python benchmarks/bench_clean.py [--size-mb 100] [--keep]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_md
+
+# 以普通正文为主，夹杂少量 Markdown 标记、非 ASCII 字符和需要移除的符号
+WORDS = ["The", "quick", "brown", "fox", "jumps", "over", "the", "lazy", "dog,", "and", "then",
+         "it", "was", "a", "long", "night.", "She", "said", "déjà", "vu;", "(note)", "—",
+         "**bold**", "l'été", "中文", "测试。", "[link](url)"]
+
+
+def generate_markdown(path, size_mb, seed=0):
+    """生成约 size_mb MB 的合成 Markdown：标题、列表、带多余空白的段落和多余空行"""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            kind = rng.random()
+            if kind < 0.05:
+                block = f"## Chapter {rng.randint(1, 999)}"
+            elif kind < 0.15:
+                block = '\n'.join(f"- {' '.join(rng.choices(WORDS, k=6))}" for _ in range(rng.randint(2, 5)))
+            else:
+                lines = []
+                for _ in range(rng.randint(1, 4)):
+                    indent = "  " if rng.random() < 0.2 else ""
+                    trailing = " \t" if rng.random() < 0.2 else ""
+                    words = rng.choices(WORDS, k=rng.randint(5, 25))
+                    spacing = "  " if rng.random() < 0.1 else " "
+                    lines.append(indent + spacing.join(words) + trailing)
+                block = '\n'.join(lines)
+            separator = "\n\n" if rng.random() < 0.8 else "\n   \n\n\t\n"
+            f.write(block + separator)
+            written += len(block.encode('utf-8')) + len(separator)
+
+
+def multipass_clean(content):
+    """旧版实现：对整篇文本依次执行七遍 re.sub，作为对照"""
+    # 1. 移除连续的空行，只保留一个空行
+    cleaned_content = re.sub(r'\n\s*\n\s*\n+', '\n\n', content)
+
+    # 2. 移除行首行尾的空白字符（空格、制表符等）
+    cleaned_content = re.sub(r'^[ \t]+|[ \t]+$', '', cleaned_content, flags=re.MULTILINE)
+
+    # 3. 移除除了文字、数字、标点符号和基本空格之外的特殊字符
+    # 保留：字母、数字、中文、基本标点符号、空格、换行符
+    # 移除：制表符、特殊空白字符、控制字符等
+    cleaned_content = re.sub(r'[^\w\s\u4e00-\u9fff\u3000-\u303f\uff00-\uffef\n\r.,!?;:()\[\]{}""''\-\u2013\u2014\u2026]', '', cleaned_content)
+
+    # 4. 规范化空格：将多个连续空格替换为单个空格
+    cleaned_content = re.sub(r' +', ' ', cleaned_content)
+
+    # 5. 移除空行中的空格
+    cleaned_content = re.sub(r'^\s+$', '', cleaned_content, flags=re.MULTILINE)
+
+    # 6. 移除文件开头和结尾的多余空行
+    cleaned_content = cleaned_content.strip()
+
+    # 7. 确保段落之间只有一个空行
+    cleaned_content = re.sub(r'\n\s*\n\s*\n+', '\n\n', cleaned_content)
+
+    return cleaned_content
+
+
+def run_multipass(input_file, output_file):
+    with open(input_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(multipass_clean(content))
+
+
+def run_pipeline(input_file, output_file):
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for cleaned in clean_md.clean_chunks(clean_md.iter_chunks(input_file)):
+            f.write(cleaned)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比多遍清理与单遍清理流水线的速度")
+    parser.add_argument("--size-mb", type=int, default=100, help="合成文件大小 (默认: 100)")
+    parser.add_argument("--keep", action="store_true", help="保留生成的临时文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_clean_")
+    source = os.path.join(workdir, "book.md")
+    multipass_out = os.path.join(workdir, "multipass.md")
+    pipeline_out = os.path.join(workdir, "pipeline.md")
+
+    print(f"生成 {args.size_mb} MB 合成 Markdown: {source}")
+    generate_markdown(source, args.size_mb)
+
+    multipass_time = timed(run_multipass, source, multipass_out)
+    pipeline_time = timed(run_pipeline, source, pipeline_out)
+
+    with open(multipass_out, 'rb') as a, open(pipeline_out, 'rb') as b:
+        identical = a.read() == b.read()
+
+    size_mb = os.path.getsize(source) / 1024 / 1024
+    print(f"多遍 re.sub:   {multipass_time:.2f} 秒 ({size_mb / multipass_time:.1f} MB/s)")
+    print(f"单遍流水线:    {pipeline_time:.2f} 秒 ({size_mb / pipeline_time:.1f} MB/s)")
+    print(f"加速比:        {multipass_time / pipeline_time:.2f}x")
+    print(f"输出一致:      {'是' if identical else '否'}")
+
+    if not args.keep:
+        for path in (source, multipass_out, pipeline_out):
+            os.remove(path)
+        os.rmdir(workdir)
+
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
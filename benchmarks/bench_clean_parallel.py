@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程清理的扩展性基准
+生成一个大的合成 Markdown 文件和一个包含多本小书的目录，分别用不同的进程数清理，
+报告耗时和相对单进程的加速比，并检查每种进程数的输出与单进程逐字节一致
+
+用法：python benchmarks/bench_clean_parallel.py [--size-mb 200] [--books 50] [--workers 1,2,4,8] [--keep]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_md
+from bench_clean import generate_markdown
+
+
+def parse_workers(value):
+    return [int(n) for n in value.split(',') if n.strip()]
+
+
+def run(files, workers, shard_size):
+    """清理 files，返回耗时（秒）"""
+    start = time.perf_counter()
+    for _ in clean_md.clean_files(files, workers, shard_size=shard_size):
+        pass
+    return time.perf_counter() - start
+
+
+def read_outputs(files):
+    outputs = []
+    for _, output_file in files:
+        with open(output_file, 'rb') as f:
+            outputs.append(f.read())
+    return outputs
+
+
+def bench(name, inputs, workdir, workers_list, shard_size):
+    """用各个进程数清理 inputs，返回输出是否都与单进程一致"""
+    size_mb = sum(os.path.getsize(path) for path in inputs) / 1024 / 1024
+    print(f"\n== {name}: {len(inputs)} 个文件，共 {size_mb:.0f} MB ==")
+    print(f"  {'进程数':<8}{'耗时':>10}{'MB/s':>10}{'加速比':>10}  输出一致")
+    baseline_time = None
+    baseline_outputs = None
+    identical = True
+    for workers in [1] + [n for n in workers_list if n != 1]:
+        output_dir = os.path.join(workdir, f"{name}_out_{workers}")
+        os.makedirs(output_dir)
+        files = [(path, os.path.join(output_dir, os.path.basename(path))) for path in inputs]
+        elapsed = run(files, workers, shard_size)
+        outputs = read_outputs(files)
+        if baseline_time is None:
+            baseline_time, baseline_outputs = elapsed, outputs
+            same = True
+        else:
+            same = outputs == baseline_outputs
+            identical = identical and same
+        print(f"  {workers:<8}{elapsed:>9.2f}s{size_mb / elapsed:>10.1f}{baseline_time / elapsed:>9.2f}x  "
+              f"{'是' if same else '否'}")
+        shutil.rmtree(output_dir)
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量多进程清理在不同进程数下的扩展性")
+    parser.add_argument("--size-mb", type=int, default=200, help="单个大文件的大小，目录中的书总大小相同 (默认: 200)")
+    parser.add_argument("--books", type=int, default=50, help="目录中的书本数 (默认: 50)")
+    parser.add_argument("--workers", type=parse_workers, default=[1, 2, 4, 8],
+                        help="要测量的进程数，逗号分隔 (默认: 1,2,4,8)")
+    parser.add_argument("--shard-mb", type=float, default=clean_md.SHARD_SIZE / 1024 / 1024,
+                        help=f"分片大小，单位百万字符 (默认: {clean_md.SHARD_SIZE // 1024 // 1024})")
+    parser.add_argument("--keep", action="store_true", help="保留生成的临时文件")
+    args = parser.parse_args()
+    shard_size = int(args.shard_mb * 1024 * 1024)
+
+    workdir = tempfile.mkdtemp(prefix="bench_clean_parallel_")
+    print(f"CPU 核数: {os.cpu_count()}，合成文件目录: {workdir}")
+    big_file = os.path.join(workdir, "book.md")
+    generate_markdown(big_file, args.size_mb)
+    books_dir = os.path.join(workdir, "books")
+    os.makedirs(books_dir)
+    books = []
+    for n in range(args.books):
+        path = os.path.join(books_dir, f"book_{n:04d}.md")
+        generate_markdown(path, max(1, args.size_mb // args.books), seed=n)
+        books.append(path)
+
+    identical = bench("单个大文件", [big_file], workdir, args.workers, shard_size)
+    identical = bench("多本书", books, workdir, args.workers, shard_size) and identical
+
+    if not args.keep:
+        shutil.rmtree(workdir)
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
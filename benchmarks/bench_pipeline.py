@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端吞吐量基准
+生成 1k–100k 段的合成书籍，用离线模拟后端（mock_backend.py）依次测量
+清理、合并、缩减、翻译、生成EPUB 各阶段的耗时、每秒段落数和内存，
+并检查中断（部分请求失败、进度文件末尾损坏）后恢复翻译的结果是否与一次完成的结果一致
+
+用法：python benchmarks/bench_pipeline.py [--sizes 1000,10000,100000] [--latency 0.01] [--memory] [--output bench.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import translate_md_to_epub as translator
+from bench_clean import WORDS
+from clean_md import clean_chunks
+from deepseek_client import DeepSeekClient
+from epub_builder import build_epub
+from md_stream import iter_chunks, iter_paragraphs, read_paragraphs, split_lines
+from merge_paragraphs import merge_short_paragraphs
+from mock_backend import mock_adapter
+from progress_journal import read_journal
+from reduce_paragraphs import regroup_by_tokens
+from run_report import RunStats
+
+
+def generate_book(path, paragraphs, seed=0):
+    """生成恰好 paragraphs 段的合成书籍：章节标题、列表、长短不一的正文和多余空白"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for n in range(paragraphs):
+            kind = rng.random()
+            if kind < 0.03:
+                block = f"## Chapter {n}"
+            elif kind < 0.10:
+                block = '\n'.join(f"- {' '.join(rng.choices(WORDS, k=6))}" for _ in range(rng.randint(2, 4)))
+            else:
+                words = rng.choices(WORDS, k=rng.randint(8, 120))
+                block = ("  " if rng.random() < 0.1 else "") + ' '.join(words) + (" \t" if rng.random() < 0.1 else "")
+            f.write(block + ("\n\n" if rng.random() < 0.9 else "\n  \n\n"))
+
+
+def max_rss_mb():
+    # Linux 上 ru_maxrss 的单位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(name, count, func, track_memory):
+    """执行一个阶段并返回 (结果, 指标)"""
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    seconds = time.perf_counter() - start
+    metrics = {"stage": name, "paragraphs": count, "seconds": round(seconds, 3),
+               "paragraphs_per_second": round(count / seconds, 1) if seconds else None,
+               "max_rss_mb": round(max_rss_mb(), 1)}
+    if track_memory:
+        metrics["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    return result, metrics
+
+
+def make_client(mock_url, concurrency, stats=None, max_retries=5):
+    return DeepSeekClient("bench", api_url=mock_url, transport=mock_adapter(mock_url), max_retries=max_retries,
+                          rate_limit=1e6, pool_size=concurrency, backoff_base=0.01, stats=stats)
+
+
+def translate(paragraphs, progress_file, mock_url, args, stats=None, max_retries=5, resume=False):
+    translator.progress_file = progress_file
+    client = make_client(mock_url, args.concurrency, stats, max_retries)
+    try:
+        return translator.paragraphs_translate(paragraphs, "bench", "en", progress_file,
+                                               concurrency=args.concurrency, client=client,
+                                               batch_tokens=args.batch_tokens, stats=stats, resume=resume)
+    finally:
+        client.close()
+
+
+def check_resume(paragraphs, expected, workdir, args):
+    """模拟中断后恢复：先让部分请求失败并损坏进度文件末尾，再恢复翻译，结果必须与一次完成的一致"""
+    progress_file = os.path.join(workdir, "resume_progress.jsonl")
+    failing_url = f"mock://local?error_rate=0.3&seed=7&latency={args.latency}"
+    with contextlib.redirect_stdout(io.StringIO()):
+        translate(paragraphs, progress_file, failing_url, args, max_retries=0)
+    _, entries = read_journal(progress_file)
+    kept = len(entries)
+    # 模拟写到一半时进程被杀
+    with open(progress_file, 'a', encoding='utf-8') as f:
+        f.write('{"i": 0, "h": "torn')
+
+    stats = RunStats()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = translate(paragraphs, progress_file, args.mock_url, args, stats=stats, resume=True)
+    report = stats.report()
+    return {
+        "stage": "resume",
+        "paragraphs": len(paragraphs),
+        "kept_after_failures": kept,
+        "retranslated": report["paragraphs"]["translated_this_run"],
+        "requests": report["requests"]["count"],
+        "identical": result == expected,
+    }
+
+
+def bench_size(count, args):
+    workdir = tempfile.mkdtemp(prefix=f"bench_pipeline_{count}_")
+    source = os.path.join(workdir, "book.md")
+    generate_book(source, count)
+    results = []
+    try:
+        cleaned, metrics = measure("clean", count, lambda: list(
+            iter_paragraphs(split_lines(clean_chunks(iter_chunks(source))))), args.memory)
+        results.append(metrics)
+
+        merged, metrics = measure("merge", len(cleaned), lambda: list(
+            merge_short_paragraphs(cleaned, 150)), args.memory)
+        results.append(metrics)
+
+        _, metrics = measure("reduce", len(merged), lambda: list(
+            regroup_by_tokens(merged, args.batch_tokens)), args.memory)
+        results.append(metrics)
+
+        # 翻译未清理的原文：清理会去掉 #，译文中没有标题的话 EPUB 只有一章，测不到分章和并行转换
+        paragraphs = list(read_paragraphs(source))
+        progress_file = os.path.join(workdir, "progress.jsonl")
+        translated, metrics = measure("translate", len(paragraphs), lambda: translate(
+            paragraphs, progress_file, args.mock_url, args), args.memory)
+        results.append(metrics)
+
+        chapters, metrics = measure("epub", len(translated), lambda: build_epub(
+            translated, os.path.join(workdir, "book.epub"), workers=args.epub_workers), args.memory)
+        metrics["chapters"] = chapters
+        results.append(metrics)
+
+        if not args.skip_resume:
+            results.append(check_resume(paragraphs, translated, workdir, args))
+    finally:
+        if args.keep:
+            print(f"临时文件保留在: {workdir}")
+        else:
+            shutil.rmtree(workdir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用离线模拟后端测量各处理阶段的吞吐量、内存和恢复正确性")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="合成书籍的段落数，逗号分隔 (默认: 1000,10000，可加上 100000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟后端每次请求的延迟秒数 (默认: 0)")
+    parser.add_argument("--mock", default="", help="附加的模拟后端参数，如 error_rate=0.01&burst_every=100&burst_length=3")
+    parser.add_argument("-j", "--concurrency", type=int, default=16, help="翻译并发数 (默认: 16)")
+    parser.add_argument("--batch-tokens", type=int, default=translator.DEFAULT_BATCH_TOKENS,
+                        help=f"每个请求打包的 token 预算 (默认: {translator.DEFAULT_BATCH_TOKENS})")
+    parser.add_argument("--epub-workers", type=int, default=1, help="转换EPUB章节的进程数 (默认: 1)")
+    parser.add_argument("--memory", action="store_true",
+                        help="用 tracemalloc 统计每个阶段的峰值内存（会拖慢各阶段）")
+    parser.add_argument("--skip-resume", action="store_true", help="跳过恢复正确性检查")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--keep", action="store_true", help="保留生成的临时文件")
+    args = parser.parse_args()
+    args.mock_url = f"mock://local?latency={args.latency}" + (f"&{args.mock}" if args.mock else "")
+
+    all_results = {}
+    ok = True
+    for count in [int(size) for size in args.sizes.split(',') if size.strip()]:
+        print(f"\n== {count} 段 ==")
+        results = bench_size(count, args)
+        all_results[count] = results
+        for metrics in results:
+            if metrics["stage"] == "resume":
+                ok = ok and metrics["identical"]
+                print(f"{'resume':<10} 失败后保留 {metrics['kept_after_failures']} 段，"
+                      f"重新翻译 {metrics['retranslated']} 段，"
+                      f"结果一致: {'是' if metrics['identical'] else '否'}")
+                continue
+            line = (f"{metrics['stage']:<10} {metrics['paragraphs']:>7} 段  {metrics['seconds']:>8.3f} 秒  "
+                    f"{metrics['paragraphs_per_second'] or 0:>10.1f} 段/秒  RSS {metrics['max_rss_mb']:.0f} MB")
+            if "chapters" in metrics:
+                line += f"  {metrics['chapters']} 章"
+            if "peak_traced_mb" in metrics:
+                line += f"  峰值 {metrics['peak_traced_mb']} MB"
+            print(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
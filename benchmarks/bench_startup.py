@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准
+冷启动各个命令行脚本若干次，报告墙钟时间；再用 python -X importtime 统计各模块的导入耗时，
+列出最慢的导入。清理、解码、列出进度这类命令不应加载 requests、markdown 等重量级依赖，
+--check 时发现这种情况就以非零状态退出。
+
+解释器本身和 site（包括环境中安装的 .pth 钩子）的耗时单独列为“空解释器”，与本项目无关。
+
+用法：python benchmarks/bench_startup.py [--runs 10] [--top 8] [--check]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在真正翻译、生成 EPUB 或使用缓存时才需要的模块
+HEAVY_MODULES = ("requests", "urllib3", "markdown", "sqlite3", "multiprocessing")
+
+# 导入时都不应加载 HEAVY_MODULES 的模块
+MODULES = ("clean_md", "decode_progress", "progress_journal", "dedup", "glossary",
+           "epub_builder", "translate_md_to_epub", "batch_translate", "pipeline")
+
+
+def commands(workdir):
+    """(名称, 命令行参数) 列表，在 workdir 中运行"""
+    return [
+        ("空解释器", ["-c", "pass"]),
+        ("clean_md.py", [os.path.join(ROOT, "clean_md.py"), "book.md", "book_clean.md"]),
+        ("decode_progress.py --list", [os.path.join(ROOT, "decode_progress.py"), "--list"]),
+        ("translate_md_to_epub.py --help", [os.path.join(ROOT, "translate_md_to_epub.py"), "--help"]),
+        ("batch_translate.py --help", [os.path.join(ROOT, "batch_translate.py"), "--help"]),
+        ("pipeline.py --help", [os.path.join(ROOT, "pipeline.py"), "--help"]),
+        ("epub_builder.py --help", [os.path.join(ROOT, "epub_builder.py"), "--help"]),
+    ]
+
+
+def prepare(workdir):
+    """准备一个小的 Markdown 文件和进度日志，让 clean_md 和 --list 有实际内容可处理"""
+    sys.path.insert(0, ROOT)
+    from progress_journal import ProgressJournal, paragraph_hash, source_hash
+
+    paragraphs = [f"Paragraph {i}  with   some\ttext." for i in range(100)]
+    with open(os.path.join(workdir, "book.md"), 'w', encoding='utf-8') as f:
+        f.write("\n\n".join(paragraphs))
+    hashes = [paragraph_hash(p) for p in paragraphs]
+    journal = ProgressJournal(os.path.join(workdir, "book_progress.jsonl"))
+    journal.start(len(paragraphs), "en", {}, source_hash(hashes))
+    for i in range(50):
+        journal.append(i, hashes[i], f"第 {i} 段")
+    journal.close()
+
+
+def time_command(args, workdir, runs):
+    """运行 runs 次，返回每次的墙钟时间（秒）"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def import_profile(module):
+    """用 -X importtime 导入 module，返回 (总耗时微秒, [(累计微秒, 模块名)]，加载的重量级模块)"""
+    code = (f"import sys; import {module}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    entries = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0:
+            # 子模块的行出现在父模块之前；遇到其他顶层模块（如 site）时丢弃它们的依赖
+            if name == module:
+                total = int(cumulative)
+                break
+            entries = []
+        elif depth == 1:
+            # 只看入口模块的直接依赖，深层的导入已计入它们的累计耗时
+            entries.append((int(cumulative), name))
+    heavy = [m for m in result.stdout.strip().split(",") if m]
+    return total, sorted(entries, reverse=True), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量命令行脚本的冷启动耗时和各模块的导入耗时")
+    parser.add_argument("--runs", type=int, default=10, help="每个命令运行的次数 (默认: 10)")
+    parser.add_argument("--top", type=int, default=5, help="每个模块列出最慢的几个直接导入 (默认: 5)")
+    parser.add_argument("--check", action="store_true", help="有模块在导入时加载了重量级依赖时以非零状态退出")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+        prepare(workdir)
+        print(f"冷启动墙钟时间（{args.runs} 次）:")
+        print(f"  {'命令':<32}{'最短':>10}{'中位数':>10}")
+        for name, command in commands(workdir):
+            times = time_command(command, workdir, args.runs)
+            print(f"  {name:<32}{min(times) * 1000:>8.1f}ms{statistics.median(times) * 1000:>8.1f}ms")
+
+    print("\n导入耗时（python -X importtime，不含解释器和 site）:")
+    violations = []
+    for module in MODULES:
+        total, entries, heavy = import_profile(module)
+        print(f"  {module:<24}{total / 1000:>8.1f}ms" + (f"  加载了: {', '.join(heavy)}" if heavy else ""))
+        for cumulative, name in entries[:args.top]:
+            print(f"      {name:<28}{cumulative / 1000:>6.1f}ms")
+        if heavy:
+            violations.append(module)
+
+    if violations:
+        print(f"\n以下模块在导入时加载了重量级依赖: {', '.join(violations)}")
+    if args.check and violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,214 @@
+import argparse
+import os
 import re
+from collections import deque
+from functools import partial
+from itertools import chain, groupby, islice
 
-def clean_markdown(input_file, output_file):
-    """清理Markdown文件中的多余空行和特殊字符"""
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 1. 移除连续的空行，只保留一个空行
-    cleaned_content = re.sub(r'\n\s*\n\s*\n+', '\n\n', content)
-    
-    # 2. 移除行首行尾的空白字符（空格、制表符等）
-    cleaned_content = re.sub(r'^[ \t]+|[ \t]+$', '', cleaned_content, flags=re.MULTILINE)
-    
-    # 3. 移除除了文字、数字、标点符号和基本空格之外的特殊字符
-    # 保留：字母、数字、中文、基本标点符号、空格、换行符
-    # 移除：制表符、特殊空白字符、控制字符等
-    cleaned_content = re.sub(r'[^\w\s\u4e00-\u9fff\u3000-\u303f\uff00-\uffef\n\r.,!?;:()\[\]{}""''\-\u2013\u2014\u2026]', '', cleaned_content)
-    
-    # 4. 规范化空格：将多个连续空格替换为单个空格
-    cleaned_content = re.sub(r' +', ' ', cleaned_content)
-    
-    # 5. 移除空行中的空格
-    cleaned_content = re.sub(r'^\s+$', '', cleaned_content, flags=re.MULTILINE)
-    
-    # 6. 移除文件开头和结尾的多余空行
-    cleaned_content = cleaned_content.strip()
-    
-    # 7. 确保段落之间只有一个空行
-    cleaned_content = re.sub(r'\n\s*\n\s*\n+', '\n\n', cleaned_content)
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(cleaned_content)
-    
-    print(f"清理完成！原文件: {input_file}")
-    print(f"清理后文件: {output_file}")
-    print(f"清理前字符数: {len(content)}")
-    print(f"清理后字符数: {len(cleaned_content)}")
+from md_stream import iter_chunks
+
+# 以下规则都只作用于单行内部，可以按块（整行对齐）依次执行，无需对整篇文本做多遍替换
+
+# 保留：字母、数字、中文、基本标点符号、空格、换行符
+# 移除：制表符、特殊空白字符、控制字符等
+SPECIAL_CHARS_PATTERN = re.compile(r'[^\w\s\u4e00-\u9fff\u3000-\u303f\uff00-\uffef\n\r.,!?;:()\[\]{}""''\-\u2013\u2014\u2026]')
+MULTIPLE_SPACES_PATTERN = re.compile(r' {2,}')
+# 连续的空行（包括只含空白字符的行）
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+
+# 多进程清理时每个分片的字符数
+SHARD_SIZE = 8 * 1024 * 1024
+
+def strip_line_edges(text):
+    """移除行首行尾的空白字符（空格、制表符）"""
+    return '\n'.join([line.strip(' \t') for line in text.split('\n')])
+
+def remove_special_chars(text):
+    """移除除了文字、数字、标点符号和基本空格之外的特殊字符"""
+    return SPECIAL_CHARS_PATTERN.sub('', text)
+
+def collapse_spaces(text):
+    """规范化空格：将多个连续空格替换为单个空格"""
+    return MULTIPLE_SPACES_PATTERN.sub(' ', text)
+
+# 默认的行内清理规则，按顺序执行；可以传入自定义的规则序列
+LINE_RULES = (strip_line_edges, remove_special_chars, collapse_spaces)
+
+def line_blocks(chunks):
+    """把任意切分的文本块重新对齐到整行：除最后一块外，每块都以换行符结束"""
+    carry = ''
+    for chunk in chunks:
+        text = carry + chunk
+        cut = text.rfind('\n') + 1
+        if cut == 0:
+            carry = text
+            continue
+        yield text[:cut]
+        carry = text[cut:]
+    yield carry
+
+def iter_shards(chunks, shard_size=SHARD_SIZE):
+    """把文本块重新切成约 shard_size 字符的分片，供多个进程分别清理
+
+    优先在空行（段落边界）处切分，单个段落超过 shard_size 时在行尾切分，分片总是对齐到整行。
+    至少产出一个分片（空文件产出空字符串）。
+    """
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= shard_size:
+            cut = buffer.rfind('\n\n', 0, shard_size) + 2
+            if cut < 2:
+                cut = buffer.rfind('\n', 0, shard_size) + 1 or buffer.find('\n', shard_size) + 1
+            if cut == 0:
+                # 这一行还没有读完
+                break
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    yield buffer
+
+def clean_lines(text, rules=LINE_RULES):
+    """清理一段对齐到整行的文本：依次执行行内规则并合并空白行，保留首尾空白，由 join_cleaned 处理交界"""
+    for rule in rules:
+        text = rule(text)
+    return BLANK_LINES_PATTERN.sub('\n\n', text)
+
+def join_cleaned(blocks):
+    """按顺序拼接 clean_lines 的结果，逐块产出
+
+    相邻两块交界处的空白（前一块末尾和后一块开头）合在一起再合并一次空行，
+    并去掉整篇文本开头和结尾的空白，结果与把整篇文本一次清理完全相同。
+    """
+    tail = ''
+    started = False
+    for block in blocks:
+        end = len(block.rstrip())
+        if end == 0:
+            tail += block
+            continue
+        start = len(block) - len(block.lstrip())
+        head = BLANK_LINES_PATTERN.sub('\n\n', tail + block[:start]) if started else ''
+        started = True
+        tail = block[end:]
+        yield head + block[start:end]
+
+def clean_chunks(chunks, rules=LINE_RULES):
+    """单遍清理文本块序列，逐块产出清理后的文本
+
+    输入块可以在任意位置切分。每块先对齐到整行，再执行行内规则并把空白行合并为一个空行；
+    块与块交界处的空白由 join_cleaned 合并，并去掉整篇文本开头和结尾的空白。
+    """
+    return join_cleaned(clean_lines(block, rules) for block in line_blocks(chunks))
+
+def imap_ordered(function, items, workers):
+    """在 workers 个进程中对 items 执行 function，按输入顺序产出结果
+
+    最多有 2 * workers 个分片在处理或等待取走，内存占用与输入大小无关。
+    少于两项或 workers 为 1 时直接在当前进程中执行。
+    """
+    items = iter(items)
+    head = list(islice(items, 2))
+    items = chain(head, items)
+    if workers <= 1 or len(head) < 2:
+        yield from map(function, items)
+        return
+    # 调用方可能有其他线程在运行，用 spawn 启动工作进程，避免在多线程进程中 fork
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def parallel_clean_chunks(chunks, workers=None, rules=LINE_RULES, shard_size=SHARD_SIZE):
+    """多进程版的 clean_chunks：按段落边界切片，各片在工作进程中清理，结果与 clean_chunks 逐字节一致"""
+    workers = workers or os.cpu_count() or 1
+    return join_cleaned(imap_ordered(partial(clean_lines, rules=rules), iter_shards(chunks, shard_size), workers))
+
+def clean_text(text, rules=LINE_RULES):
+    """清理一段完整的 Markdown 文本"""
+    return ''.join(clean_chunks([text], rules))
+
+def clean_files(files, workers=None, rules=LINE_RULES, shard_size=SHARD_SIZE):
+    """清理多个文件，files 为 [(输入文件, 输出文件)]
+
+    所有文件的分片共用一个进程池，按文件顺序依次提交：小文件各占一片，大文件拆成多片，
+    多个文件之间和同一个大文件内部都能并行。逐文件返回 (输入文件, 输出文件, 清理前字符数, 清理后字符数)。
+    """
+    workers = workers or os.cpu_count() or 1
+    # 每个分片所属的文件和原始字符数，按提交顺序排列，与返回的结果一一对应
+    shards = deque()
+
+    def tagged():
+        for n, (input_file, _) in enumerate(files):
+            for shard in iter_shards(iter_chunks(input_file), shard_size):
+                shards.append((n, len(shard)))
+                yield shard
+
+    results = ((shards.popleft(), cleaned)
+               for cleaned in imap_ordered(partial(clean_lines, rules=rules), tagged(), workers))
+    # 每个文件至少有一个分片，分组与 files 一一对应
+    for n, group in groupby(results, key=lambda item: item[0][0]):
+        input_file, output_file = files[n]
+        original_chars = 0
+        cleaned_chars = 0
+
+        def counted(group):
+            nonlocal original_chars
+            for (_, size), cleaned in group:
+                original_chars += size
+                yield cleaned
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for cleaned in join_cleaned(counted(group)):
+                f.write(cleaned)
+                cleaned_chars += len(cleaned)
+        yield input_file, output_file, original_chars, cleaned_chars
+
+def clean_markdown(input_file, output_file, rules=LINE_RULES, workers=None, shard_size=SHARD_SIZE):
+    """清理Markdown文件中的多余空行和特殊字符，按块读取并逐块写入；大文件拆成多片并行清理"""
+    for _, _, original_chars, cleaned_chars in clean_files([(input_file, output_file)], workers, rules, shard_size):
+        print(f"清理完成！原文件: {input_file}")
+        print(f"清理后文件: {output_file}")
+        print(f"清理前字符数: {original_chars}")
+        print(f"清理后字符数: {cleaned_chars}")
+
+def main():
+    parser = argparse.ArgumentParser(description="清理Markdown文件中的多余空行和特殊字符，可多进程并行处理多个文件或单个大文件")
+    parser.add_argument("input", nargs="?", default="book.md", help="输入的Markdown文件，或包含 .md 文件的目录 (默认: book.md)")
+    parser.add_argument("output", nargs="?",
+                        help="输出文件，输入为目录时为输出目录 (默认: book_clean.md 或 <输入目录>_clean)")
+    parser.add_argument("--workers", type=int, help="并行清理的进程数，1 表示单进程 (默认: CPU核数)")
+    parser.add_argument("--shard-mb", type=float, default=SHARD_SIZE / 1024 / 1024,
+                        help=f"大文件按段落边界拆分的分片大小，单位百万字符 (默认: {SHARD_SIZE // 1024 // 1024})")
+    args = parser.parse_args()
+    shard_size = max(1, int(args.shard_mb * 1024 * 1024))
+
+    if not os.path.isdir(args.input):
+        clean_markdown(args.input, args.output or "book_clean.md", workers=args.workers, shard_size=shard_size)
+        return
+
+    output_dir = args.output or args.input.rstrip(os.sep) + "_clean"
+    os.makedirs(output_dir, exist_ok=True)
+    names = sorted(name for name in os.listdir(args.input) if name.endswith(".md"))
+    if not names:
+        print(f"目录 {args.input} 中没有 .md 文件")
+        return
+    files = [(os.path.join(args.input, name), os.path.join(output_dir, name)) for name in names]
+    total_original = total_cleaned = 0
+    for input_file, output_file, original_chars, cleaned_chars in \
+            clean_files(files, args.workers, shard_size=shard_size):
+        print(f"{input_file} → {output_file}: {original_chars} → {cleaned_chars} 字符")
+        total_original += original_chars
+        total_cleaned += cleaned_chars
+    print(f"清理完成！共 {len(files)} 个文件，清理前字符数: {total_original}，清理后字符数: {total_cleaned}")
 
 if __name__ == "__main__":
-    clean_markdown("book.md", "book_clean.md") 
\ No newline at end of file
+    main()
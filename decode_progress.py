@@ -1,99 +1,194 @@
+import argparse
 import json
 import os
 import sys
 
-def decode_progress(progress_file, output_format="md"):
-    """解码翻译进度文件，提取已翻译的段落"""
-    
+from md_stream import read_paragraphs
+from progress_journal import JournalIndex, paragraph_hash, read_journal, source_hash
+
+def read_progress(progress_file):
+    """读取进度文件：*.jsonl 为进度日志，重放得到各段最新译文；其他按旧版 JSON 读取"""
+    if progress_file.endswith(".jsonl"):
+        header, entries = read_journal(progress_file)
+        return {"translated": {i: record["t"] for i, record in entries.items()},
+                "total_paragraphs": header.get("total_paragraphs", 0),
+                "source_lang": header.get("source_lang", "unknown")}
+    with open(progress_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def translated_items(progress_data):
+    """按段落顺序返回 (段落索引, 译文) 列表，兼容旧的前缀列表格式"""
+    if "translated" in progress_data:
+        translated = progress_data["translated"]
+        return sorted((int(i), item) for i, item in translated.items())
+    return list(enumerate(progress_data.get("translated_paragraphs", [])))
+
+def item_text(item):
+    if isinstance(item, dict):
+        # 如果是字典格式，提取翻译后的文本
+        return item.get("translated", item.get("text", str(item)))
+    # 如果是字符串格式，直接使用
+    return str(item)
+
+def progress_summary(progress_file):
+    """返回 {translated, total_paragraphs, source_lang, source_hash}
+
+    进度日志（*.jsonl）通过索引读取，只读索引开头和上次更新索引后追加的记录，与文件大小无关；
+    索引缺失时扫描一遍日志建立索引。旧版 JSON 进度文件需要完整读取。
+    """
+    if progress_file.endswith(".jsonl"):
+        index = JournalIndex.open(progress_file)
+        translated, total = index.counts()
+        return {"translated": translated, "total_paragraphs": total,
+                "source_lang": index.summary.get("source_lang", "unknown"),
+                "source_hash": index.summary.get("source_hash")}
+    data = read_progress(progress_file)
+    return {"translated": len(translated_items(data)), "total_paragraphs": data.get("total_paragraphs", 0),
+            "source_lang": data.get("source_lang", "unknown"), "source_hash": None}
+
+def iter_records(progress_file, start=0, stop=None):
+    """按段落顺序逐段返回 [start, stop) 范围内的 (段落索引, 译文, 原文哈希)，旧版 JSON 没有原文哈希"""
+    if progress_file.endswith(".jsonl"):
+        for index, record in JournalIndex.open(progress_file).records(start, stop):
+            yield index, record["t"], record.get("h")
+        return
+    for index, item in translated_items(read_progress(progress_file)):
+        if index >= start and (stop is None or index < stop):
+            yield index, item_text(item), None
+
+def merge_with_source(records, source_paragraphs, start, stop):
+    """把译文与原文按段落合并：未翻译或原文已改动的段落使用原文，返回 (段落索引, 文本, 是否为译文)"""
+    pending = next(records, None)
+    for index, paragraph in enumerate(source_paragraphs):
+        if stop is not None and index >= stop:
+            break
+        while pending is not None and pending[0] < index:
+            pending = next(records, None)
+        if index < start:
+            continue
+        if pending is not None and pending[0] == index and pending[2] in (None, paragraph_hash(paragraph)):
+            yield index, pending[1], True
+        else:
+            yield index, paragraph, False
+
+def output_path(progress_file, output_format, start, stop):
+    base_name = os.path.splitext(progress_file)[0].replace("_progress", "")
+    suffix = "" if start == 0 and stop is None else f"_{start + 1}-{stop if stop is not None else 'end'}"
+    extension = {"md": "md", "txt": "txt", "epub": "epub"}[output_format]
+    return f"{base_name}_translated{suffix}.{extension}"
+
+def decode_progress(progress_file, output_format="md", start=0, stop=None, source=None, output_file=None):
+    """解码翻译进度文件，逐段导出 [start, stop) 范围内已翻译的段落
+
+    指定 source（原文 Markdown）时导出完整的书：未翻译的段落使用原文，
+    可直接生成部分翻译的 Markdown 或 EPUB。导出过程中不把整本书载入内存。
+    """
+
     if not os.path.exists(progress_file):
         print(f"错误：进度文件 {progress_file} 不存在")
         return
-    
+
+    output_format = output_format.lower()
     try:
-        with open(progress_file, 'r', encoding='utf-8') as f:
-            progress_data = json.load(f)
-    except Exception as e:
+        summary = progress_summary(progress_file)
+    except (OSError, ValueError) as e:
         print(f"读取进度文件失败: {e}")
         return
-    
+
     # 提取翻译进度信息
-    translated_paragraphs = progress_data.get("translated_paragraphs", [])
-    total_paragraphs = progress_data.get("total_paragraphs", 0)
-    source_lang = progress_data.get("source_lang", "unknown")
-    
-    if not translated_paragraphs:
+    translated_count = summary["translated"]
+    total_paragraphs = summary["total_paragraphs"]
+
+    if not translated_count and source is None:
         print("进度文件中没有已翻译的段落")
         return
-    
+
     print(f"找到翻译进度:")
-    print(f"- 已翻译段落数: {len(translated_paragraphs)}")
+    print(f"- 已翻译段落数: {translated_count}")
     print(f"- 总段落数: {total_paragraphs}")
-    print(f"- 源语言: {source_lang}")
-    print(f"- 翻译进度: {len(translated_paragraphs)/total_paragraphs*100:.1f}%")
-    
-    # 生成输出文件名
-    base_name = os.path.splitext(progress_file)[0].replace("_progress", "")
-    if output_format.lower() == "md":
-        output_file = f"{base_name}_translated.md"
+    print(f"- 源语言: {summary['source_lang']}")
+    if total_paragraphs:
+        print(f"- 翻译进度: {translated_count/total_paragraphs*100:.1f}%")
+
+    records = iter_records(progress_file, start, stop)
+    if source is not None:
+        if summary["source_hash"] and \
+                source_hash(paragraph_hash(p) for p in read_paragraphs(source)) != summary["source_hash"]:
+            print("警告：原文与进度文件记录的不一致，原文已改动的段落将使用原文")
+        items = merge_with_source(records, read_paragraphs(source), start, stop)
     else:
-        output_file = f"{base_name}_translated.txt"
-    
-    # 提取翻译内容
-    translated_content = []
-    for i, item in enumerate(translated_paragraphs, 1):
-        if isinstance(item, dict):
-            # 如果是字典格式，提取翻译后的文本
-            translated_text = item.get("translated", item.get("text", str(item)))
-        else:
-            # 如果是字符串格式，直接使用
-            translated_text = str(item)
-        
-        if output_format.lower() == "md":
-            # Markdown格式：添加段落分隔
-            translated_content.append(translated_text)
-        else:
-            # TXT格式：添加段落编号
-            translated_content.append(f"段落 {i}: {translated_text}")
-    
-    # 写入文件
-    content = "\n\n".join(translated_content)
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
+        items = ((index, text, True) for index, text, _ in records)
+
+    output_file = output_file or output_path(progress_file, output_format, start, stop)
+    exported = {"paragraphs": 0, "translated": 0, "chars": 0}
+
+    def counted(items):
+        for index, text, translated in items:
+            exported["paragraphs"] += 1
+            exported["translated"] += translated
+            exported["chars"] += len(text)
+            yield index, text
+
+    if output_format == "epub":
+        # 导入放在这里，导出 md/txt 时不需要 EPUB 相关模块
+        from epub_builder import build_epub
+        title = os.path.basename(os.path.splitext(progress_file)[0].replace("_progress", ""))
+        build_epub((text for _, text in counted(items)), output_file, title=title)
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for n, (index, text) in enumerate(counted(items)):
+                if n:
+                    f.write("\n\n")
+                # TXT格式：添加段落编号
+                f.write(text if output_format == "md" else f"段落 {index + 1}: {text}")
+
     print(f"翻译内容已保存到: {output_file}")
-    print(f"文件大小: {len(content)} 字符")
+    print(f"导出段落: {exported['paragraphs']}（其中译文 {exported['translated']}），"
+          f"共 {exported['chars']} 字符")
 
 def list_progress_files():
     """列出当前目录下的所有进度文件"""
-    progress_files = [f for f in os.listdir('.') if f.endswith('_progress.json')]
-    
+    progress_files = sorted(f for f in os.listdir('.')
+                            if f.endswith('_progress.jsonl') or f.endswith('_progress.json'))
+
     if not progress_files:
         print("当前目录下没有找到进度文件")
         return
-    
+
     print("找到以下进度文件:")
     for i, file in enumerate(progress_files, 1):
         try:
-            with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                translated_count = len(data.get("translated_paragraphs", []))
-                total_count = data.get("total_paragraphs", 0)
-                progress = f"{translated_count}/{total_count}" if total_count > 0 else f"{translated_count}"
-                print(f"{i}. {file} - 进度: {progress}")
-        except:
+            summary = progress_summary(file)
+            translated_count = summary["translated"]
+            total_count = summary["total_paragraphs"]
+            progress = f"{translated_count}/{total_count}" if total_count > 0 else f"{translated_count}"
+            print(f"{i}. {file} - 进度: {progress}")
+        except (OSError, ValueError, KeyError):
             print(f"{i}. {file} - 读取失败")
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("使用方法:")
-        print("python decode_progress.py <进度文件> [输出格式]")
-        print("python decode_progress.py --list")
-        print("\n输出格式: md (Markdown) 或 txt (纯文本)")
-        sys.exit(1)
-    
-    if sys.argv[1] == "--list":
+def main():
+    parser = argparse.ArgumentParser(description="查看翻译进度文件，并导出已翻译的段落")
+    parser.add_argument("progress_file", nargs="?", help="进度文件（*_progress.jsonl 或旧版 *_progress.json）")
+    parser.add_argument("output_format", nargs="?", default="md", choices=["md", "txt", "epub"],
+                        help="输出格式: md (Markdown)、txt (纯文本，带段落编号) 或 epub (默认: md)")
+    parser.add_argument("--list", action="store_true", help="列出当前目录下的所有进度文件")
+    parser.add_argument("--from", dest="start", type=int, default=1, help="从第几段开始导出（从1开始，默认: 1）")
+    parser.add_argument("--to", dest="end", type=int, help="导出到第几段为止（含，默认: 最后一段）")
+    parser.add_argument("--source", help="原文 Markdown 文件；指定时未翻译的段落用原文补齐，导出部分翻译的完整书籍")
+    parser.add_argument("-o", "--output", help="输出文件 (默认: <书名>_translated[_范围].<格式>)")
+    args = parser.parse_args()
+
+    if args.list:
         list_progress_files()
-    else:
-        progress_file = sys.argv[1]
-        output_format = sys.argv[2] if len(sys.argv) > 2 else "md"
-        decode_progress(progress_file, output_format) 
\ No newline at end of file
+        return
+    if not args.progress_file:
+        parser.print_help()
+        sys.exit(1)
+    if args.start < 1 or (args.end is not None and args.end < args.start):
+        print("错误：--from 必须不小于 1，且 --to 不能小于 --from")
+        sys.exit(1)
+    decode_progress(args.progress_file, args.output_format, args.start - 1, args.end,
+                    source=args.source, output_file=args.output)
+
+if __name__ == "__main__":
+    main()
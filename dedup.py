@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重复段落检测
+扫描版书籍转换来的 Markdown 里有大量重复的页眉、页码、版权声明和近似的套话。
+翻译前把以下段落分组，每组只翻译一个代表段落，再把译文分发给组内其他段落：
+- 规范化（Unicode 形式、行内空白）后完全相同的段落
+- 只有数字不同的段落（如 "Page 12" 和 "Page 13"），分发时把译文中的数字替换为该段自己的数字
+- 高度相似的短段落（需指定小于 1 的阈值）：用词级 shingle 的 MinHash + LSH 找候选，再用精确的 Jaccard 相似度确认
+
+近似合并只用于页眉页脚这类很短的套话：正文中只差一个 "not" 的两段也可能高度相似，复用译文会悄悄改变意思，
+因此默认关闭。数字替换不成立（例如译文把数字写成了中文数字）时，该段单独翻译，不会得到错误的数字。
+
+用法：python dedup.py <input.md> [--threshold 0.9]  统计重复情况，不翻译
+"""
+
+import argparse
+import random
+import re
+import zlib
+
+from md_stream import read_paragraphs
+from translation_cache import normalize_text
+
+# 近似重复的 Jaccard 相似度阈值，1 表示只合并完全相同和只有数字不同的段落（默认）
+DEFAULT_THRESHOLD = 1.0
+
+# 只对不超过该长度的段落做近似重复检测（页眉、页脚等套话都很短，更长的是正文）
+NEAR_DUP_MAX_CHARS = 200
+
+SHINGLE_SIZE = 3
+BANDS = 8
+ROWS = 2
+# MinHash 的各个哈希函数：对 crc32 结果异或不同的盐
+SALTS = [random.Random(seed).getrandbits(32) for seed in range(BANDS * ROWS)]
+
+DIGITS_PATTERN = re.compile(r'\d+')
+
+
+def template(text):
+    """规范化并把数字替换为 #，只有数字不同的段落得到相同的模板"""
+    return DIGITS_PATTERN.sub('#', normalize_text(text))
+
+
+def shingles(text):
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))}
+    return {zlib.crc32(' '.join(words[n:n + SHINGLE_SIZE]).encode('utf-8'))
+            for n in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    return [min(value ^ salt for value in shingle_set) for salt in SALTS]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def adapt_translation(source, member, translation):
+    """把代表段落的译文改写为组内另一段的译文，无法保证数字正确时返回 None"""
+    source_numbers = DIGITS_PATTERN.findall(source)
+    member_numbers = DIGITS_PATTERN.findall(member)
+    if source_numbers == member_numbers:
+        return translation
+    if len(source_numbers) != len(member_numbers) or DIGITS_PATTERN.findall(translation) != source_numbers:
+        return None
+    numbers = iter(member_numbers)
+    return DIGITS_PATTERN.sub(lambda match: next(numbers), translation)
+
+
+class DedupPlan:
+    """待翻译段落的分组结果
+
+    representatives 是需要翻译的段落索引；members[代表] 是分发译文的其他段落；
+    counts 按 exact / numbers / near 统计被合并的段落数。
+    """
+
+    def __init__(self, paragraphs, indices, threshold=DEFAULT_THRESHOLD):
+        self.paragraphs = paragraphs
+        self.members = {}
+        self.counts = {"exact": 0, "numbers": 0, "near": 0}
+        self.representatives = []
+        by_template = {}
+        buckets = {}
+        sketches = {}
+
+        for i in indices:
+            text = paragraphs[i]
+            key = template(text)
+            rep = by_template.get(key)
+            if rep is not None:
+                if normalize_text(text) == normalize_text(paragraphs[rep]):
+                    kind = "exact"
+                else:
+                    # 模板可能是由近似段落登记的，指向的代表段落不一定只有数字不同
+                    kind = "numbers" if key == template(paragraphs[rep]) else "near"
+                self._add(rep, i, kind)
+                continue
+
+            bands = None
+            if threshold < 1 and len(text) <= NEAR_DUP_MAX_CHARS:
+                sketch = shingles(key)
+                signature = minhash(sketch)
+                bands = [(band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+                candidates = dict.fromkeys(c for band in bands for c in buckets.get(band, ()))
+                # 与代表段落直接比较，避免相似关系沿链条漂移
+                rep = next((c for c in candidates if jaccard(sketch, sketches[c]) >= threshold), None)
+                if rep is not None:
+                    by_template[key] = rep
+                    self._add(rep, i, "near")
+                    continue
+                sketches[i] = sketch
+                for band in bands:
+                    buckets.setdefault(band, []).append(i)
+
+            by_template[key] = i
+            self.representatives.append(i)
+
+    def _add(self, rep, i, kind):
+        self.members.setdefault(rep, []).append(i)
+        self.counts[kind] += 1
+
+    @property
+    def duplicates(self):
+        """不需要单独翻译的段落数"""
+        return sum(self.counts.values())
+
+    def skipped(self):
+        """所有被合并的段落索引"""
+        return {i for members in self.members.values() for i in members}
+
+    def fan_out(self, rep, translation):
+        """把代表段落的译文分发给组内段落，返回 (可以直接使用的 [(索引, 译文)], 需要单独翻译的索引)"""
+        resolved = []
+        unresolved = []
+        for i in self.members.get(rep, ()):
+            text = adapt_translation(self.paragraphs[rep], self.paragraphs[i], translation)
+            if text is None:
+                unresolved.append(i)
+            else:
+                resolved.append((i, text))
+        return resolved, unresolved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计Markdown文件中的重复段落，估算去重能省下的翻译量")
+    parser.add_argument("input_md", help="输入的Markdown文件")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"近似重复的相似度阈值，1 表示只合并完全相同和只有数字不同的段落 (默认: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--show", type=int, default=10, help="显示重复最多的前几组 (默认: 10)")
+    args = parser.parse_args()
+
+    paragraphs = list(read_paragraphs(args.input_md))
+    plan = DedupPlan(paragraphs, range(len(paragraphs)), args.threshold)
+    print(f"段落数: {len(paragraphs)}，需要翻译: {len(plan.representatives)}，"
+          f"重复: {plan.duplicates}（完全相同 {plan.counts['exact']}，只有数字不同 {plan.counts['numbers']}，"
+          f"近似 {plan.counts['near']}）")
+    largest = sorted(plan.members.items(), key=lambda item: len(item[1]), reverse=True)[:args.show]
+    for rep, members in largest:
+        print(f"  ×{len(members) + 1}  {paragraphs[rep][:60]!r}")
+
+
+if __name__ == "__main__":
+    main()
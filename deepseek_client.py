@@ -0,0 +1,238 @@
+"""
+DeepSeek Chat API 客户端
+复用 HTTP 连接池，按令牌桶限流（遇到429自动降速），失败时指数退避重试；
+可选 SSE 流式模式，响应停滞超过 idle_timeout 时提前重试
+"""
+
+import json
+import random
+import threading
+import time
+
+DEFAULT_API_URL = "https://api.deepseek.com/v1/chat/completions"
+
+# 这些状态码视为临时错误，可以重试
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class TranslationError(Exception):
+    """重试耗尽或遇到不可重试的错误，无法获得译文"""
+
+
+class TruncatedResponse(TranslationError):
+    """回复达到 max_tokens 被截断（finish_reason 为 "length"）"""
+
+
+class StreamStalled(Exception):
+    """流式响应在 idle_timeout 内没有新内容"""
+
+
+class TokenBucket:
+    """令牌桶限流器
+
+    rate 为每秒允许的请求数。收到429时速率减半并遵守 Retry-After，
+    之后每次成功请求线性恢复，直到回到初始速率。
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=0.2):
+        if not rate > 0:
+            raise ValueError(f"限流速率应大于 0: {rate}")
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, retry_after=None):
+        """服务端限流：降低速率，必要时暂停到 Retry-After 之后"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def reward(self):
+        """请求成功：逐步恢复速率"""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回等待秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP 日期格式很少见，email.utils 连带导入 socket 等模块，用到时再导入
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class DeepSeekClient:
+    """带连接池、限流和重试的 Chat Completions 客户端，可在多个线程间共享"""
+
+    def __init__(self, api_key, api_url=DEFAULT_API_URL, timeout=(10, 120), max_retries=5,
+                 rate_limit=5.0, pool_size=10, backoff_base=1.0, backoff_max=60.0, stats=None,
+                 stream=False, idle_timeout=30.0, transport=None):
+        self.api_url = api_url
+        self.stats = stats
+        self.stream = stream
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = TokenBucket(rate_limit)
+
+        # requests 导入耗时约 70 毫秒，放在这里，只用到 TranslationError 等名字的模块启动时不必加载
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if transport is not None:
+            # 自定义传输层（如 mock_backend.MockAdapter），替代真实的网络请求
+            self.session.mount(api_url, transport)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def _backoff(self, attempt):
+        # 全抖动指数退避，避免多个线程同时重试
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def chat(self, payload):
+        """发送一次 Chat Completions 请求，返回解析后的 JSON 响应
+
+        流式模式下把增量内容拼接成与非流式相同结构的响应。
+        """
+        import requests
+        if self.stream:
+            payload = dict(payload, stream=True, stream_options={"include_usage": True})
+            # 流式模式下读取超时即两次收到数据之间的最长间隔
+            timeout = (self.timeout[0], self.idle_timeout)
+        else:
+            timeout = self.timeout
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            retry_after = None
+            retry_reason = "error"
+            start = time.monotonic()
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=timeout, stream=self.stream)
+                if response.status_code == 200:
+                    # 网关错误页、被截断的响应体等无法解析的 200 响应与网络错误一样重试
+                    result = self._read_stream(response, start) if self.stream else response.json()
+            except (requests.RequestException, StreamStalled, ValueError) as e:
+                self._record_request(start, "stalled" if isinstance(e, StreamStalled) else "error")
+                last_error = f"请求异常: {e}"
+                retry_reason = type(e).__name__
+            else:
+                self._record_request(start, response.status_code)
+                if response.status_code == 200:
+                    self.limiter.reward()
+                    if self.stats is not None:
+                        self.stats.record_usage(result.get("usage"))
+                    return result
+                last_error = f"{response.status_code} - {response.text[:200]}"
+                retry_reason = str(response.status_code)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self._record_failure()
+                    raise TranslationError(last_error)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    self.limiter.penalize(retry_after)
+
+            if attempt == self.max_retries:
+                break
+            if self.stats is not None:
+                self.stats.record_retry(retry_reason)
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            print(f"请求失败 ({last_error})，{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+
+        self._record_failure()
+        raise TranslationError(f"重试 {self.max_retries} 次后仍然失败: {last_error}")
+
+    def _read_stream(self, response, start):
+        """读取 SSE 流，返回拼接好的响应；超过 idle_timeout 没有新内容时抛出 StreamStalled"""
+        import requests
+        parts = []
+        finish_reason = None
+        usage = None
+        last_content = start
+        try:
+            # chunk_size=None：收到多少处理多少，不等待凑满缓冲区
+            for line in response.iter_lines(chunk_size=None):
+                now = time.monotonic()
+                # 服务端排队时只发送 keep-alive 注释，它们不算作进展
+                if not line.startswith(b'data:'):
+                    if now - last_content > self.idle_timeout:
+                        raise StreamStalled(f"{self.idle_timeout:g} 秒内没有收到新内容")
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        if not parts and self.stats is not None:
+                            self.stats.record_first_token(now - start)
+                        parts.append(content)
+                        last_content = now
+                    finish_reason = choice.get("finish_reason") or finish_reason
+        except ValueError as e:
+            raise requests.RequestException(f"流式响应格式异常: {e}")
+        finally:
+            response.close()
+        if finish_reason is None:
+            raise requests.RequestException("流式响应在结束前中断")
+        return {"choices": [{"message": {"role": "assistant", "content": ''.join(parts)},
+                             "finish_reason": finish_reason}],
+                "usage": usage}
+
+    def _record_request(self, start, status):
+        if self.stats is not None:
+            self.stats.record_request(time.monotonic() - start, status)
+
+    def _record_failure(self):
+        if self.stats is not None:
+            self.stats.record_failure()
+
+    def close(self):
+        self.session.close()
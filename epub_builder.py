@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按章节流式生成EPUB
+在 Markdown 标题处把书拆成多个章节，每章单独转换为 XHTML（可在多个进程中并行），
+转换好一章就写入 EPUB 压缩包一章，最后生成目录；峰值内存只与最大的章节有关
+"""
+
+import argparse
+import hashlib
+import itertools
+import os
+import re
+import sys
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import Future
+from html import escape
+from html.entities import name2codepoint
+from xml.etree import ElementTree
+
+from md_stream import read_paragraphs
+
+# 在不高于该级别的标题处分章（1 表示只按 # 分章，2 表示按 # 和 ## 分章）
+DEFAULT_CHAPTER_LEVEL = 2
+
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+
+ENTITY_PATTERN = re.compile(r'&([A-Za-z][A-Za-z0-9]*);')
+XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+
+# 修改章节模板或转换规则时递增，使缓存的章节失效
+RENDER_VERSION = 1
+
+# 固定压缩包内文件的时间戳，内容相同的书生成的EPUB逐字节相同
+ZIP_DATE_TIME = (2000, 1, 1, 0, 0, 0)
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="EPUB/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+CHAPTER_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{lang}" xml:lang="{lang}">
+<head>
+<meta charset="utf-8"/>
+<title>{title}</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def heading(paragraph):
+    """段落以 Markdown 标题开头时返回 (级别, 标题文字)，否则返回 None"""
+    match = HEADING_PATTERN.match(paragraph.split('\n', 1)[0])
+    if not match:
+        return None
+    return len(match.group(1)), match.group(2)
+
+
+def split_chapters(paragraphs, chapter_level=DEFAULT_CHAPTER_LEVEL, default_title="正文"):
+    """逐章产出 (章节标题, 段落列表)
+
+    遇到级别不高于 chapter_level 的标题时开始新的一章；第一个标题之前的内容单独成章。
+    """
+    title = default_title
+    chapter = []
+    for paragraph in paragraphs:
+        found = heading(paragraph)
+        if found and found[0] <= chapter_level and chapter:
+            yield title, chapter
+            chapter = []
+        if found and found[0] <= chapter_level:
+            title = found[1] or default_title
+        chapter.append(paragraph)
+    if chapter:
+        yield title, chapter
+
+
+def xml_entity(match):
+    """HTML 命名实体（如 &nbsp;）在 XHTML 中未定义，改为数字字符引用"""
+    name = match.group(1)
+    if name in XML_ENTITIES:
+        return match.group(0)
+    if name in name2codepoint:
+        return f"&#{name2codepoint[name]};"
+    return f"&amp;{name};"
+
+
+def markdown_to_xhtml(text):
+    """Markdown 转 XHTML 片段；原文中的 HTML 不是合法 XML 时按普通文本转义"""
+    # markdown 只在转换章节时才需要，不在模块导入时加载
+    import markdown
+    body = ENTITY_PATTERN.sub(xml_entity, markdown.markdown(text, output_format='xhtml'))
+    try:
+        ElementTree.fromstring(f"<body>{body}</body>")
+    except ElementTree.ParseError:
+        converter = markdown.Markdown(output_format='xhtml')
+        converter.preprocessors.deregister('html_block')
+        converter.inlinePatterns.deregister('html')
+        converter.inlinePatterns.deregister('entity')
+        body = ENTITY_PATTERN.sub(xml_entity, converter.convert(text))
+    return body
+
+
+def render_chapter(title, paragraphs, lang="zh"):
+    """把一章 Markdown 转换为完整的 XHTML 文档（在工作进程中执行）"""
+    body = markdown_to_xhtml('\n\n'.join(paragraphs))
+    return CHAPTER_TEMPLATE.format(lang=lang, title=escape(title), body=body)
+
+
+class EpubWriter:
+    """逐章写入 EPUB 压缩包，只在内存中保留每章的标题和文件名"""
+
+    def __init__(self, output_path, title, lang="zh", identifier=None):
+        self.output_path = output_path
+        self.title = title
+        self.lang = lang
+        # 未指定标识符时由标题和全部章节内容决定（见 close）：同一本书重复生成时不变，
+        # 不同的书即使标题相同（默认标题）也不会在阅读器的书库中互相覆盖
+        self.identifier = identifier
+        self.content_digest = hashlib.sha256(f"{lang}\0{title}\0".encode('utf-8'))
+        self.chapters = []
+        self.tmp_path = output_path + '.tmp'
+        self.zip = zipfile.ZipFile(self.tmp_path, 'w')
+        # mimetype 必须是第一个文件且不压缩
+        self._write('mimetype', 'application/epub+zip', zipfile.ZIP_STORED)
+        self._write('META-INF/container.xml', CONTAINER_XML)
+
+    def _write(self, name, content, compress_type=zipfile.ZIP_DEFLATED):
+        info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+        info.compress_type = compress_type
+        self.zip.writestr(info, content)
+
+    def add_chapter(self, title, xhtml):
+        """写入一章已转换好的 XHTML"""
+        file_name = f"chap_{len(self.chapters) + 1:04d}.xhtml"
+        self._write(f"EPUB/{file_name}", xhtml)
+        self.chapters.append((title, file_name))
+        self.content_digest.update(f"{title}\0{xhtml}\0".encode('utf-8'))
+
+    def _nav(self):
+        items = '\n'.join(f'      <li><a href="{file_name}">{escape(title)}</a></li>'
+                          for title, file_name in self.chapters)
+        body = (f'<nav epub:type="toc" id="toc">\n<h1>{escape(self.title)}</h1>\n'
+                f'    <ol>\n{items}\n    </ol>\n</nav>')
+        return CHAPTER_TEMPLATE.format(lang=self.lang, title=escape(self.title), body=body)
+
+    def _ncx(self):
+        points = '\n'.join(
+            f'    <navPoint id="navpoint-{n}" playOrder="{n}"><navLabel><text>{escape(title)}</text></navLabel>'
+            f'<content src="{file_name}"/></navPoint>'
+            for n, (title, file_name) in enumerate(self.chapters, 1))
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n'
+                f'<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+                f'  <head><meta name="dtb:uid" content="{escape(self.identifier)}"/></head>\n'
+                f'  <docTitle><text>{escape(self.title)}</text></docTitle>\n'
+                f'  <navMap>\n{points}\n  </navMap>\n</ncx>\n')
+
+    def _opf(self):
+        manifest = '\n'.join(
+            f'    <item id="chap_{n}" href="{file_name}" media-type="application/xhtml+xml"/>'
+            for n, (_, file_name) in enumerate(self.chapters, 1))
+        spine = '\n'.join(f'    <itemref idref="chap_{n}"/>' for n in range(1, len(self.chapters) + 1))
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n'
+                f'<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">\n'
+                f'  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+                f'    <dc:identifier id="id">{escape(self.identifier)}</dc:identifier>\n'
+                f'    <dc:title>{escape(self.title)}</dc:title>\n'
+                f'    <dc:language>{self.lang}</dc:language>\n'
+                f'    <meta property="dcterms:modified">2000-01-01T00:00:00Z</meta>\n'
+                f'  </metadata>\n'
+                f'  <manifest>\n'
+                f'    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'
+                f'    <item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>\n'
+                f'{manifest}\n'
+                f'  </manifest>\n'
+                f'  <spine toc="ncx">\n'
+                f'    <itemref idref="nav" linear="no"/>\n'
+                f'{spine}\n'
+                f'  </spine>\n'
+                f'</package>\n')
+
+    def close(self):
+        """写入目录和包文件，完成后原子替换目标文件"""
+        if self.identifier is None:
+            self.identifier = f"urn:uuid:{uuid.UUID(bytes=self.content_digest.digest()[:16], version=5)}"
+        self._write('EPUB/nav.xhtml', self._nav())
+        self._write('EPUB/toc.ncx', self._ncx())
+        self._write('EPUB/content.opf', self._opf())
+        self.zip.close()
+        os.replace(self.tmp_path, self.output_path)
+
+    def abort(self):
+        self.zip.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class ChapterCache:
+    """按内容哈希缓存每章转换好的 XHTML
+
+    保存在输出文件旁的目录中，重新生成时只转换内容有变化的章节；
+    每次生成后删除本书已不再使用的章节。
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.used = set()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, title, paragraphs, lang="zh"):
+        digest = hashlib.sha256(f"{RENDER_VERSION}\0{lang}\0{title}\0".encode('utf-8'))
+        for paragraph in paragraphs:
+            digest.update(paragraph.encode('utf-8'))
+            digest.update(b'\n\n')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.xhtml")
+
+    def get(self, key):
+        self.used.add(key)
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, xhtml):
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(xhtml)
+        os.replace(tmp_path, path)
+
+    def prune(self):
+        for name in os.listdir(self.cache_dir):
+            if name[:-len('.xhtml')] not in self.used:
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def chapter_cache_dir(output_path):
+    """EPUB 对应的章节缓存目录"""
+    return f"{os.path.splitext(output_path)[0]}_epub_cache"
+
+
+def build_epub(paragraphs, output_path, title="翻译电子书", chapter_level=DEFAULT_CHAPTER_LEVEL, workers=None,
+               cache_dir=None):
+    """按章节生成EPUB，返回章节数
+
+    workers 为转换章节的进程数（默认 CPU 核数，1 表示在当前进程中转换）。
+    最多有 2 * workers 章在转换或等待写入，按原顺序写入压缩包。
+    指定 cache_dir 时复用内容未变化的章节，只转换有变化的章节。
+    """
+    workers = workers or os.cpu_count() or 1
+    writer = EpubWriter(output_path, title)
+    cache = ChapterCache(cache_dir) if cache_dir else None
+    chapters = split_chapters(paragraphs, chapter_level, default_title=title)
+    # 只有一章时不值得启动进程池
+    head = list(itertools.islice(chapters, 2))
+    chapters = itertools.chain(head, chapters)
+    use_pool = workers > 1 and len(head) > 1
+    pool = None
+    pending = deque()
+    rendered = 0
+
+    def write_next():
+        chapter_title, key, result = pending.popleft()
+        if isinstance(result, Future):
+            result = result.result()
+        if cache is not None and key is not None:
+            cache.put(key, result)
+        writer.add_chapter(chapter_title, result)
+
+    try:
+        for chapter_title, chapter in chapters:
+            key = cache.key(chapter_title, chapter) if cache is not None else None
+            result = cache.get(key) if cache is not None else None
+            if result is not None:
+                # 缓存命中，写入时无需再保存
+                key = None
+            else:
+                rendered += 1
+                if use_pool:
+                    if pool is None:
+                        import multiprocessing
+                        from concurrent.futures import ProcessPoolExecutor
+                        # 调用方可能还有翻译线程在运行，用 spawn 启动工作进程，避免在多线程进程中 fork
+                        pool = ProcessPoolExecutor(max_workers=workers,
+                                                   mp_context=multiprocessing.get_context("spawn"))
+                    result = pool.submit(render_chapter, chapter_title, chapter)
+                else:
+                    result = render_chapter(chapter_title, chapter)
+            pending.append((chapter_title, key, result))
+            while len(pending) >= 2 * workers or (pending and pool is None):
+                write_next()
+        while pending:
+            write_next()
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    writer.close()
+    if cache is not None:
+        cache.prune()
+        print(f"EPUB 共 {len(writer.chapters)} 章，重新转换 {rendered} 章，"
+              f"复用缓存 {len(writer.chapters) - rendered} 章")
+    return len(writer.chapters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把Markdown文件按章节转换为EPUB")
+    parser.add_argument("input_md", help="输入的Markdown文件")
+    parser.add_argument("output_epub", help="输出的EPUB文件")
+    parser.add_argument("--title", default="翻译电子书", help="EPUB标题")
+    parser.add_argument("--chapter-level", type=int, default=DEFAULT_CHAPTER_LEVEL,
+                        help=f"在不高于该级别的标题处分章 (默认: {DEFAULT_CHAPTER_LEVEL})")
+    parser.add_argument("-j", "--workers", type=int, help="转换章节的进程数 (默认: CPU核数)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用章节缓存 (默认缓存在 <输出文件名>_epub_cache 目录，只重新转换有变化的章节)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input_md):
+        print(f"错误：文件 {args.input_md} 不存在")
+        sys.exit(1)
+    count = build_epub(read_paragraphs(args.input_md), args.output_epub, title=args.title,
+                       chapter_level=args.chapter_level, workers=args.workers,
+                       cache_dir=None if args.no_cache else chapter_cache_dir(args.output_epub))
+    print(f"转换完成，共 {count} 章，输出文件: {args.output_epub}")
+
+
+if __name__ == "__main__":
+    main()
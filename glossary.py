@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本书术语表
+从原文中找出反复出现的专有名词（人名、地名、组织名等），只翻译一次并保存到
+<输入文件名>_glossary.json，之后每个翻译请求只附带其中在本批原文里出现的条目，
+使同一个名字在全书中的译法保持一致。术语表文件可以手工修改，译名留空的条目不会使用。
+
+匹配用 Aho-Corasick 自动机：一次扫描原文找出所有术语，耗时与原文长度成正比，与术语数量无关。
+
+用法：python glossary.py <input.md> [--min-count 3]  只列出候选术语，不翻译
+"""
+
+import argparse
+import json
+import os
+import re
+from collections import Counter, deque
+
+from md_stream import read_paragraphs
+
+# 出现次数不少于该值的专有名词才收入术语表
+DEFAULT_MIN_COUNT = 3
+DEFAULT_MAX_TERMS = 500
+
+# 大写字母开头的连续单词，允许中间夹着 de/von/of 等小写连接词（如 "Jean de la Fontaine"）
+NAME_PATTERN = re.compile(
+    r"[A-ZÀ-ÖØ-Þ][\w'’-]*(?:[ \t]+(?:(?:de|du|des|la|le|von|van|der|of|the)[ \t]+)*[A-ZÀ-ÖØ-Þ][\w'’-]*)*")
+LOWER_WORD_PATTERN = re.compile(r"\b[a-zà-öø-ÿ][\w'’-]*")
+
+
+class AhoCorasick:
+    """多模式字符串匹配自动机"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern)
+
+        # 按层次计算失败指针，并把失败状态的输出并入当前状态
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def finditer(self, text):
+        """返回所有匹配的 (起始位置, 模式)，包括相互重叠的匹配"""
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for pattern in self.output[state]:
+                yield position - len(pattern) + 1, pattern
+
+
+def extract_terms(paragraphs, min_count=DEFAULT_MIN_COUNT, max_terms=DEFAULT_MAX_TERMS):
+    """找出出现至少 min_count 次的专有名词，按出现次数从多到少返回 [(术语, 次数)]
+
+    句首大写的普通词（The、But 等）在正文中也会以小写出现，据此把它们排除。
+    """
+    paragraphs = list(paragraphs)
+    lower_words = set()
+    for paragraph in paragraphs:
+        lower_words.update(LOWER_WORD_PATTERN.findall(paragraph))
+
+    counts = Counter()
+    for paragraph in paragraphs:
+        for match in NAME_PATTERN.finditer(paragraph):
+            words = match.group().split()
+            # 去掉开头的普通词，如 "The Duke" 中的 The
+            while words and words[0].lower() in lower_words:
+                words.pop(0)
+            if words and len(words[0]) > 1:
+                counts[' '.join(words)] += 1
+    return [(term, count) for term, count in counts.most_common(max_terms) if count >= min_count]
+
+
+def glossary_path(input_md):
+    return f"{os.path.splitext(input_md)[0]}_glossary.json"
+
+
+class Glossary:
+    """术语表：{原文: 译名}，只使用译名非空的条目"""
+
+    def __init__(self, terms=None):
+        self.terms = {term: translation for term, translation in (terms or {}).items() if translation}
+        self.matcher = AhoCorasick(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+    @classmethod
+    def load(cls, path):
+        """读取术语表文件，不存在时返回空术语表"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f).get("terms", {}))
+
+    def matches(self, text):
+        """原文中完整出现（前后不是字母或数字）的术语"""
+        found = set()
+        for start, term in self.matcher.finditer(text):
+            end = start + len(term)
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                found.add(term)
+        return found
+
+    def relevant(self, texts):
+        """这些原文用到的术语条目，按术语排序，相同的原文总是得到相同的提示词"""
+        found = set()
+        for text in texts:
+            found |= self.matches(text)
+        return [(term, self.terms[term]) for term in sorted(found)]
+
+
+def save_glossary(path, terms, source_lang):
+    """保存术语表，terms 为 {原文: 译名}，保留文件中已有（可能手工修改过）的条目"""
+    existing = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = json.load(f).get("terms", {})
+    merged = {**terms, **existing}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"source_lang": source_lang, "terms": merged}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列出Markdown文件中反复出现的专有名词（术语表候选）")
+    parser.add_argument("input_md", help="输入的Markdown文件")
+    parser.add_argument("--min-count", type=int, default=DEFAULT_MIN_COUNT,
+                        help=f"最少出现次数 (默认: {DEFAULT_MIN_COUNT})")
+    parser.add_argument("--max-terms", type=int, default=DEFAULT_MAX_TERMS,
+                        help=f"最多列出的术语数 (默认: {DEFAULT_MAX_TERMS})")
+    args = parser.parse_args()
+
+    for term, count in extract_terms(read_paragraphs(args.input_md), args.min_count, args.max_terms):
+        print(f"{count:>6}  {term}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+流式读取和写入 Markdown 段落
+按块读取文件、逐段产出，输出也逐段写入，峰值内存只与最长的段落有关，与文件大小无关
+"""
+
+import os
+import sys
+
+# 读取文件时的缓冲区大小
+READ_BUFFER_SIZE = 1024 * 1024
+
+# 按块读取时每块的字符数
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def iter_lines(file_path, buffer_size=READ_BUFFER_SIZE, keepends=False):
+    """逐行读取文件，keepends 为 False 时去掉行尾换行符"""
+    if not os.path.exists(file_path):
+        print(f"错误：文件 {file_path} 不存在")
+        sys.exit(1)
+    with open(file_path, 'r', encoding='utf-8', buffering=buffer_size) as f:
+        for line in f:
+            yield line if keepends or not line.endswith('\n') else line[:-1]
+
+
+def iter_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """按固定大小的块读取文件，块边界可能落在行中间"""
+    if not os.path.exists(file_path):
+        print(f"错误：文件 {file_path} 不存在")
+        sys.exit(1)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def split_lines(chunks):
+    """把任意切分的文本块重新组合成行（不含换行符）"""
+    carry = ''
+    for chunk in chunks:
+        lines = (carry + chunk).split('\n')
+        carry = lines.pop()
+        yield from lines
+    if carry:
+        yield carry
+
+
+def iter_paragraphs(lines, strip=True):
+    """把行序列按空行（只含空白字符的行）切分成段落
+
+    strip 为 False 时保留段落内各行原样，供需要逐字节处理的清理步骤使用。
+    """
+    block = []
+    for line in lines:
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield '\n'.join(block).strip() if strip else '\n'.join(block)
+            block = []
+    if block:
+        yield '\n'.join(block).strip() if strip else '\n'.join(block)
+
+
+def read_paragraphs(file_path, strip=True):
+    """流式读取 Markdown 文件中的段落"""
+    return iter_paragraphs(iter_lines(file_path), strip=strip)
+
+
+class ParagraphWriter:
+    """逐段写入 Markdown 文件，段落之间用一个空行分隔"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, 'w', encoding='utf-8')
+        self.count = 0
+        self.chars = 0
+
+    def write(self, paragraph):
+        if self.count:
+            self.file.write('\n\n')
+            self.chars += 2
+        self.file.write(paragraph)
+        self.count += 1
+        self.chars += len(paragraph)
+
+    def write_all(self, paragraphs):
+        for paragraph in paragraphs:
+            self.write(paragraph)
+        return self
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
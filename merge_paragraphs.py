@@ -1,49 +1,67 @@
-import re
-
-def merge_paragraphs(input_file, output_file, min_length=100):
-    """合并短段落，减少段落数量"""
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 按双换行分割段落
-    paragraphs = content.split('\n\n')
-    
-    merged_paragraphs = []
+import argparse
+
+from md_stream import ParagraphWriter, read_paragraphs
+from tokens import estimate_tokens
+
+def merge_short_paragraphs(paragraphs, min_length=100, measure=len):
+    """逐段合并短段落：当前段落短于 min_length 时把下一段接在后面
+
+    measure 决定长度的计算方式，默认按字符数，传入 estimate_tokens 时按估算的 token 数
+    """
     current_paragraph = ""
-    
+    current_length = 0
+
     for paragraph in paragraphs:
-        paragraph = paragraph.strip()
-        if not paragraph:  # 跳过空段落
-            continue
-            
         # 如果当前段落太短，尝试合并
-        if len(current_paragraph) < min_length and current_paragraph:
+        if current_length < min_length and current_paragraph:
             # 合并段落，用空格分隔
             current_paragraph += " " + paragraph
+            current_length = measure(current_paragraph)
         else:
             # 保存当前段落，开始新段落
             if current_paragraph:
-                merged_paragraphs.append(current_paragraph)
+                yield current_paragraph
             current_paragraph = paragraph
-    
+            current_length = measure(paragraph)
+
     # 添加最后一个段落
     if current_paragraph:
-        merged_paragraphs.append(current_paragraph)
-    
-    # 重新组合内容
-    merged_content = '\n\n'.join(merged_paragraphs)
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(merged_content)
-    
+        yield current_paragraph
+
+def merge_paragraphs(input_file, output_file, min_length=100, measure=len):
+    """合并短段落，减少段落数量，逐段读取和写入"""
+    original_count = 0
+
+    def counted_paragraphs():
+        nonlocal original_count
+        for paragraph in read_paragraphs(input_file):
+            original_count += 1
+            yield paragraph
+
+    with ParagraphWriter(output_file) as writer:
+        writer.write_all(merge_short_paragraphs(counted_paragraphs(), min_length, measure))
+
     print(f"段落合并完成！")
     print(f"原文件: {input_file}")
     print(f"合并后文件: {output_file}")
-    print(f"原段落数: {len(paragraphs)}")
-    print(f"合并后段落数: {len(merged_paragraphs)}")
-    print(f"减少段落数: {len(paragraphs) - len(merged_paragraphs)}")
-    print(f"平均段落长度: {len(merged_content) // len(merged_paragraphs)} 字符")
+    print(f"原段落数: {original_count}")
+    print(f"合并后段落数: {writer.count}")
+    print(f"减少段落数: {original_count - writer.count}")
+    print(f"平均段落长度: {writer.chars // max(1, writer.count)} 字符")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="合并Markdown中的短段落，减少段落数量",
+        epilog="示例：python merge_paragraphs.py book_clean.md book_merged.md 150 --tokens")
+    parser.add_argument("input_file", nargs="?", default="book_clean.md", help="输入文件 (默认: book_clean.md)")
+    parser.add_argument("output_file", nargs="?", default="book_merged.md", help="输出文件 (默认: book_merged.md)")
+    # 可以调整 min_length 来控制合并的阈值
+    parser.add_argument("min_length", nargs="?", type=int, default=150, help="最短段落长度 (默认: 150)")
+    parser.add_argument("--tokens", action="store_true", help="min_length 按估算的 token 数而不是字符数计算")
+    args = parser.parse_args()
+
+    merge_paragraphs(args.input_file, args.output_file, min_length=args.min_length,
+                     measure=estimate_tokens if args.tokens else len)
 
 if __name__ == "__main__":
-    # 可以调整min_length参数来控制合并的阈值
-    merge_paragraphs("book_clean.md", "book_merged.md", min_length=150) 
\ No newline at end of file
+    main()
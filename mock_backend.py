@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线模拟翻译后端
+模拟 Chat Completions 接口：可配置延迟、随机错误、429 突发、回复截断和流式响应停滞，
+不需要访问 api.deepseek.com 就能测试和压测整个翻译流程。
+
+两种用法：
+- 进程内：把 --api-url 设为 mock://local?latency=0.05&error_rate=0.01 等，
+  请求经由 MockAdapter 在本进程内完成，仍然走 DeepSeekClient 的限流、重试和流式解析
+- 独立服务：python mock_backend.py --port 8765 --latency 0.05，
+  然后把 --api-url 设为 http://127.0.0.1:8765/
+"""
+
+import argparse
+import io
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from tokens import estimate_tokens
+
+MOCK_SCHEME = "mock://"
+
+MARKER_PATTERN = re.compile(r'<<<P\d+>>>')
+
+# 模拟译文的前缀，便于在输出中识别
+TRANSLATION_PREFIX = "[译] "
+
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+# 行首的 Markdown 标记（标题、列表、引用）原样保留，前缀加在它们之后，译文仍能按标题分章
+BLOCK_MARKER_PATTERN = re.compile(r'(?:\s*(?:#{1,6}\s+|[-*+]\s+|\d+[.)]\s+|>\s?))*')
+# 模拟译文把西文标点换成中文标点
+PUNCTUATION = str.maketrans({".": "。", ",": "，", "?": "？", "!": "！", ";": "；", ":": "："})
+
+# 与 translate_md_to_epub.SOURCE_HEADER 一致
+SOURCE_HEADER = "原文："
+
+# 服务端前缀缓存的粒度（token）
+CACHE_UNIT_TOKENS = 64
+
+
+class MockBackend:
+    """模拟服务端的行为
+
+    latency: 每次请求的平均延迟（秒），jitter 为上下浮动的比例
+    error_rate: 返回 500 的概率
+    burst_every / burst_length: 每 burst_every 个请求中有连续 burst_length 个返回 429
+    retry_after: 429 响应的 Retry-After 秒数
+    truncate_rate: 随机返回 finish_reason=length 的概率
+    truncate_tokens: 原文估算 token 数超过该值的请求总是被截断（0 表示不限制）
+    stall_rate: 请求超时（模拟流式响应停滞）的概率
+    untranslated_rate: 原文的某一行被原样返回、没有翻译的概率（用于测试译文质量检查）
+    """
+
+    def __init__(self, latency=0.0, jitter=0.2, error_rate=0.0, burst_every=0, burst_length=0,
+                 retry_after=0.1, truncate_rate=0.0, truncate_tokens=0, stall_rate=0.0,
+                 untranslated_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.truncate_rate = truncate_rate
+        self.truncate_tokens = truncate_tokens
+        self.stall_rate = stall_rate
+        self.untranslated_rate = untranslated_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.seen_prefixes = set()
+
+    @classmethod
+    def from_url(cls, url):
+        """从 mock://local?latency=0.05&error_rate=0.01 形式的地址读取参数"""
+        params = {}
+        for name, value in parse_qsl(urlsplit(url).query):
+            params[name] = int(value) if name in ("burst_every", "burst_length", "truncate_tokens", "seed") \
+                else float(value)
+        return cls(**params)
+
+    def delay(self):
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency * factor)
+
+    def respond(self, payload):
+        """返回 (状态码, 响应头, 响应体字节)；需要模拟停滞时返回 None"""
+        with self.lock:
+            n = self.requests
+            self.requests += 1
+            roll_error, roll_stall, roll_truncate = (self.random.random() for _ in range(3))
+
+        if self.burst_every and n % self.burst_every < self.burst_length:
+            return 429, {"Retry-After": str(self.retry_after)}, b'{"error": "rate limited"}'
+        if roll_error < self.error_rate:
+            return 500, {}, b'{"error": "internal error"}'
+        if roll_stall < self.stall_rate:
+            return None
+
+        prompt = payload["messages"][-1]["content"]
+        source = fake_source(prompt)
+        untranslated = set()
+        if self.untranslated_rate:
+            with self.lock:
+                untranslated = {n for n in range(source.count('\n') + 1)
+                                if self.random.random() < self.untranslated_rate}
+        content = fake_translate(source, untranslated)
+        finish_reason = "stop"
+        if roll_truncate < self.truncate_rate or \
+                (self.truncate_tokens and estimate_tokens(source) > self.truncate_tokens):
+            content = content[:len(content) // 2]
+            finish_reason = "length"
+        usage = self.usage(payload["messages"], content)
+
+        if payload.get("stream"):
+            return 200, {"Content-Type": "text/event-stream"}, sse_body(content, finish_reason, usage)
+        body = {"choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": finish_reason}],
+                "usage": usage}
+        return 200, {"Content-Type": "application/json"}, json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+    def usage(self, messages, content):
+        """模拟服务端的前缀缓存：之前见过的系统消息按整块计入缓存命中"""
+        system = ''.join(message["content"] for message in messages if message["role"] == "system")
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        with self.lock:
+            hit = system in self.seen_prefixes
+            self.seen_prefixes.add(system)
+        hit_tokens = int(estimate_tokens(system)) // CACHE_UNIT_TOKENS * CACHE_UNIT_TOKENS if hit else 0
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": estimate_tokens(content),
+                "prompt_cache_hit_tokens": hit_tokens, "prompt_cache_miss_tokens": prompt_tokens - hit_tokens}
+
+
+def fake_source(prompt):
+    """取出提示词中待翻译的部分：原文在 "原文：" 一行之后，之前是术语表和说明"""
+    _, separator, source = prompt.partition(SOURCE_HEADER + '\n')
+    return source if separator else prompt
+
+
+def fake_word(match):
+    """把一个西文单词确定地换成长度约为三分之一的汉字串"""
+    word = match.group()
+    seed = zlib.crc32(word.lower().encode('utf-8'))
+    return ''.join(chr(0x4e00 + (seed + n * 7919) % 0x5000) for n in range(len(word) // 3 + 1))
+
+
+def fake_line(line):
+    """模拟翻译一行：保留行首的 Markdown 标记，其后加前缀，把单词换成汉字、标点换成中文标点"""
+    marker = BLOCK_MARKER_PATTERN.match(line).group()
+    return marker + TRANSLATION_PREFIX + WORD_PATTERN.sub(fake_word, line[len(marker):]).translate(PUNCTUATION)
+
+
+def fake_translate(text, untranslated=()):
+    """模拟翻译：每行用 fake_line 翻译，批量标记原样保留
+
+    untranslated 中的行号原样返回，模拟模型漏译。
+    """
+    return '\n'.join(line if MARKER_PATTERN.fullmatch(line) or not line or n in untranslated
+                     else fake_line(line)
+                     for n, line in enumerate(text.split('\n')))
+
+
+def sse_body(content, finish_reason, usage, piece_size=16):
+    events = []
+    for start in range(0, len(content), piece_size):
+        chunk = {"choices": [{"index": 0, "delta": {"content": content[start:start + piece_size]},
+                              "finish_reason": None}]}
+        events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+    events.append(f"data: {json.dumps({'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish_reason}], 'usage': usage})}\n\n")
+    events.append("data: [DONE]\n\n")
+    return ''.join(events).encode('utf-8')
+
+
+class MockAdapter(BaseAdapter):
+    """requests 传输适配器：在进程内把请求交给 MockBackend，不建立网络连接"""
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        time.sleep(self.backend.delay())
+        result = self.backend.respond(json.loads(request.body))
+        if result is None:
+            raise requests.exceptions.ReadTimeout("模拟的响应停滞", request=request)
+        status, headers, body = result
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status == 200 else "Error"
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = 'utf-8'
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def mock_adapter(api_url):
+    """api_url 为 mock:// 地址时返回对应的传输适配器，否则返回 None"""
+    if not api_url.startswith(MOCK_SCHEME):
+        return None
+    return MockAdapter(MockBackend.from_url(api_url))
+
+
+def make_server(backend, port):
+    """创建模拟后端的 HTTP 服务（port 为 0 时由系统分配端口），由调用方运行 serve_forever"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            time.sleep(backend.delay())
+            result = backend.respond(payload)
+            if result is None:
+                # 不返回任何数据，客户端读取超时
+                time.sleep(3600)
+                return
+            status, headers, body = result
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(backend, port):
+    """以 HTTP 服务的形式运行模拟后端"""
+    server = make_server(backend, port)
+    print(f"模拟后端已启动: http://127.0.0.1:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n模拟后端已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动离线模拟翻译后端（HTTP服务）")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口 (默认: 8765)")
+    parser.add_argument("--latency", type=float, default=0.0, help="平均延迟秒数 (默认: 0)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟浮动比例 (默认: 0.2)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率 (默认: 0)")
+    parser.add_argument("--burst-every", type=int, default=0, help="每多少个请求出现一次 429 突发 (默认: 0 不出现)")
+    parser.add_argument("--burst-length", type=int, default=0, help="每次 429 突发的请求数 (默认: 0)")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="429 响应的 Retry-After 秒数 (默认: 0.1)")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="随机截断回复的概率 (默认: 0)")
+    parser.add_argument("--truncate-tokens", type=int, default=0,
+                        help="原文超过该 token 数的请求总是被截断 (默认: 0 不限制)")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="请求停滞不返回的概率 (默认: 0)")
+    parser.add_argument("--untranslated-rate", type=float, default=0.0,
+                        help="原文的一行被原样返回（漏译）的概率 (默认: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子 (默认: 0)")
+    args = parser.parse_args()
+    backend = MockBackend(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          burst_every=args.burst_every, burst_length=args.burst_length,
+                          retry_after=args.retry_after, truncate_rate=args.truncate_rate,
+                          truncate_tokens=args.truncate_tokens, stall_rate=args.stall_rate,
+                          untranslated_rate=args.untranslated_rate, seed=args.seed)
+    serve(backend, args.port)
+
+
+if __name__ == "__main__":
+    main()
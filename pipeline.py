@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一体化处理流程
+在一个进程内依次执行 清理 → 合并 → 缩减 → 翻译 → 生成EPUB，阶段之间直接在内存中传递段落；
+输入和参数都没有变化的阶段直接复用上次保存的结果
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import translate_md_to_epub as translator
+from clean_md import parallel_clean_chunks
+from md_stream import iter_chunks, iter_paragraphs, read_paragraphs, split_lines
+from merge_paragraphs import merge_short_paragraphs
+from progress_journal import remove_journal
+from reduce_paragraphs import preserve_structure, regroup_by_tokens
+from run_report import RunStats
+from tokens import estimate_tokens
+
+# 各阶段的固定执行顺序
+STAGES = ("clean", "merge", "reduce", "translate", "epub")
+DEFAULT_STAGES = "clean,merge,translate,epub"
+
+STATE_FILE = "state.json"
+# 阶段结果的保存格式，参与缓存键；格式变化后旧的阶段结果自动失效
+ARTIFACT_FORMAT = "jsonl-1"
+
+
+def file_hash(file_path):
+    """计算输入文件内容的哈希"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_key(previous_key, stage, params):
+    """阶段的缓存键：由上游阶段的键和本阶段参数决定，无需先算出上游的输出"""
+    material = json.dumps([previous_key, stage, params, ARTIFACT_FORMAT], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def stage_params(stage, args):
+    """影响阶段输出的参数，变化后该阶段及其下游都会重新执行"""
+    if stage == "merge":
+        if args.min_tokens:
+            return {"min_tokens": args.min_tokens}
+        return {"min_length": args.min_length}
+    if stage == "reduce":
+        if args.reduce_tokens:
+            return {"reduce_tokens": args.reduce_tokens}
+        return {"target_count": args.target_count}
+    if stage == "translate":
+        params = {"source_lang": args.source_lang, "model": translator.MODEL,
+                  "prompt_version": translator.PROMPT_VERSION, "temperature": translator.TEMPERATURE}
+        if args.dedup:
+            # 近似重复的段落共用译文，输出可能不同
+            params["dedup_threshold"] = args.dedup_threshold
+        if args.glossary:
+            # 手工修改术语表文件后需要 --force 重新翻译
+            params["glossary_min_count"] = args.glossary_min_count
+        return params
+    if stage == "epub":
+        return {"title": args.title, "output": os.path.abspath(args.output_epub),
+                "chapter_level": args.chapter_level}
+    return {}
+
+
+def write_artifact(path, paragraphs):
+    """保存阶段结果：每行一个 JSON 字符串
+
+    缩减阶段的一个单元可能包含多个段落（单元内有空行），按空行分隔保存的话重新读取时会被拆开，
+    因此每个单元单独编码，原样读回。先写临时文件再原子替换。
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        for paragraph in paragraphs:
+            f.write(json.dumps(paragraph, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+
+def read_artifact(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def load_state(work_dir):
+    path = os.path.join(work_dir, STATE_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            print(f"状态文件损坏，将重新执行所有阶段: {path}")
+    return {}
+
+
+def save_state(work_dir, state):
+    """原子写入状态文件"""
+    path = os.path.join(work_dir, STATE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def parse_stages(value):
+    selected = [stage.strip() for stage in value.split(',') if stage.strip()]
+    unknown = [stage for stage in selected if stage not in STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知阶段: {', '.join(unknown)}，可选: {', '.join(STAGES)}")
+    # 始终按固定顺序执行
+    return [stage for stage in STAGES if stage in selected]
+
+
+def run_stage(stage, paragraphs, args, work_dir, stats):
+    """执行一个阶段，返回 (输出段落, 是否完整完成)"""
+    if stage == "clean":
+        chunks = parallel_clean_chunks(iter_chunks(args.input_md), args.clean_workers)
+        return list(iter_paragraphs(split_lines(chunks))), True
+    if stage == "merge":
+        if args.min_tokens:
+            return list(merge_short_paragraphs(paragraphs, args.min_tokens, estimate_tokens)), True
+        return list(merge_short_paragraphs(paragraphs, args.min_length)), True
+    if stage == "reduce":
+        if args.reduce_tokens:
+            return list(regroup_by_tokens(paragraphs, args.reduce_tokens)), True
+        return preserve_structure(paragraphs, args.target_count), True
+    if stage == "translate":
+        return run_translate(paragraphs, args, work_dir, stats)
+    if stage == "epub":
+        translator.md_to_epub(paragraphs, args.output_epub, title=args.title, chapter_level=args.chapter_level,
+                              workers=args.epub_workers, use_cache=not args.no_epub_cache)
+        print(f"转换完成，输出文件: {args.output_epub}")
+        return paragraphs, True
+    raise ValueError(stage)
+
+
+def run_translate(paragraphs, args, work_dir, stats):
+    api_key = translator.resolve_api_key(args.api_key)
+    if args.source_lang not in ["en", "fr"]:
+        print("source_lang 只支持 'en' 或 'fr'")
+        sys.exit(1)
+
+    translator.progress_file = os.path.join(work_dir, "translate_progress.jsonl")
+    client = translator.create_client(args, api_key, stats)
+    cache = translator.open_cache(args)
+    try:
+        translated = translator.paragraphs_translate(
+            paragraphs, api_key, args.source_lang, translator.progress_file,
+            concurrency=args.concurrency, client=client, batch_tokens=args.batch_tokens, cache=cache,
+            stats=stats, dedup=translator.dedup_threshold(args),
+            glossary=translator.open_glossary(args, args.input_md, paragraphs, client),
+            retranslate_flagged=args.retranslate_flagged)
+    finally:
+        client.close()
+        translator.close_cache(cache)
+
+    complete = (len(translator.current_journal.entries) == len(paragraphs) and
+                not translator.flagged_paragraphs(translator.current_journal))
+    if not complete:
+        print(f"部分段落翻译失败或译文可疑，保留进度文件: {translator.progress_file}")
+    else:
+        # 结果已作为阶段输出保存，不再需要进度文件
+        remove_journal(translator.progress_file)
+    return translated, complete
+
+
+def run_pipeline(args, stats):
+    stages = args.stages
+    work_dir = args.work_dir or f"{os.path.splitext(args.input_md)[0]}.pipeline"
+    os.makedirs(work_dir, exist_ok=True)
+
+    # 按顺序计算各阶段的缓存键
+    keys = {}
+    key = file_hash(args.input_md)
+    for stage in stages:
+        key = stage_key(key, stage, stage_params(stage, args))
+        keys[stage] = key
+
+    # 找到最后一个输入和参数都没变、且结果仍在的阶段，从它之后开始执行
+    state = {} if args.force else load_state(work_dir)
+    start = 0
+    paragraphs = None
+    for n in range(len(stages) - 1, -1, -1):
+        stage = stages[n]
+        record = state.get(stage)
+        if record and record.get("key") == keys[stage] and os.path.exists(record["artifact"]):
+            start = n + 1
+            if stage != "epub":
+                paragraphs = read_artifact(record["artifact"])
+            break
+
+    for stage in stages[:start]:
+        print(f"[{stage}] 输入和参数未变化，跳过")
+
+    if start < len(stages) and paragraphs is None and stages[start] != "clean":
+        paragraphs = list(read_paragraphs(args.input_md))
+
+    upstream_complete = True
+    for stage in stages[start:]:
+        print(f"[{stage}] 开始执行")
+        with stats.stage(stage):
+            paragraphs, complete = run_stage(stage, paragraphs, args, work_dir, stats)
+        # 上游阶段未完整完成时，本阶段的结果也不能复用
+        complete = upstream_complete = complete and upstream_complete
+        if stage == "epub":
+            artifact = args.output_epub
+        else:
+            artifact = os.path.join(work_dir, f"{stage}.jsonl")
+            write_artifact(artifact, paragraphs)
+        print(f"[{stage}] 完成，段落数: {len(paragraphs)}")
+
+        if complete:
+            state[stage] = {"key": keys[stage], "artifact": artifact}
+        else:
+            # 未完整完成的阶段及其下游下次都要重新执行
+            for later in STAGES[STAGES.index(stage):]:
+                state.pop(later, None)
+        save_state(work_dir, state)
+
+    return paragraphs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="一体化处理流程：清理、合并、缩减、翻译Markdown并生成EPUB，阶段间在内存中传递")
+    parser.add_argument("input_md", help="输入的Markdown文件")
+    parser.add_argument("-o", "--output-epub", help="输出的EPUB文件 (默认: <输入文件名>_translated.epub)")
+    parser.add_argument("--stages", type=parse_stages, default=parse_stages(DEFAULT_STAGES),
+                        help=f"要执行的阶段，逗号分隔，可选 {','.join(STAGES)} (默认: {DEFAULT_STAGES})")
+    parser.add_argument("--work-dir", help="保存阶段结果和状态的目录 (默认: <输入文件名>.pipeline)")
+    parser.add_argument("--force", action="store_true", help="忽略上次的结果，重新执行所有阶段")
+    parser.add_argument("--clean-workers", type=int,
+                        help="清理阶段大文件按段落边界分片并行清理的进程数 (默认: CPU核数)")
+    parser.add_argument("--min-length", type=int, default=150, help="合并阶段的最短段落长度 (默认: 150)")
+    parser.add_argument("--min-tokens", type=int,
+                        help="合并阶段改为按估算的 token 数判断短段落，取代 --min-length")
+    parser.add_argument("--target-count", type=int, default=10, help="缩减阶段的目标段落数 (默认: 10)")
+    parser.add_argument("--reduce-tokens", type=int,
+                        help="缩减阶段改为按 token 预算分组，每组接近该 token 数，不跨越标题和列表，取代 --target-count")
+    parser.add_argument("--api-key", help="DeepSeek API密钥 (默认读取环境变量 DEEPSEEK_API_KEY)")
+    parser.add_argument("--source-lang", default="en", help="源语言 en/fr (默认: en)")
+    parser.add_argument("--title", default="翻译电子书", help="EPUB标题")
+    translator.add_translation_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input_md):
+        print(f"错误：文件 {args.input_md} 不存在")
+        sys.exit(1)
+    if not args.output_epub:
+        args.output_epub = f"{os.path.splitext(args.input_md)[0]}_translated.epub"
+
+    print(f"开始处理文件: {args.input_md}")
+    print(f"执行阶段: {' → '.join(args.stages)}")
+    stats = RunStats()
+    try:
+        run_pipeline(args, stats)
+    except KeyboardInterrupt:
+        print("\n用户中断程序")
+        translator.save_progress()
+        print("进度已保存，可以稍后继续")
+    finally:
+        translator.finish_report(stats, args.report)
+
+
+if __name__ == "__main__":
+    main()
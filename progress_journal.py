@@ -0,0 +1,404 @@
+"""
+翻译进度日志
+只追加的 JSONL 文件：第一行是头部（总段落数、源语言、原文哈希），之后每完成一段追加一行
+{"i": 段落索引, "h": 原文哈希, "t": 译文}；质量检查发现问题的译文另有 "q": [问题]，
+用户已接受的译文另有 "a": true（见 quality.py）。
+每段的写入代价固定，fsync 按批进行；重写整个文件（压缩）时先写临时文件再原子替换。
+翻译时由 CheckpointWriter 在后台线程中写入，翻译循环只把记录放进有界队列。
+
+日志旁边的 <日志>.idx 是索引：开头是固定长度的 JSON 摘要（段落数、已完成数、原文哈希、
+已索引的日志长度），之后是每段最新记录在日志中的字节偏移。查看进度只需读摘要，
+按范围导出只读取需要的记录，与日志大小无关。
+"""
+
+import hashlib
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from array import array
+
+JOURNAL_VERSION = 1
+
+INDEX_VERSION = 1
+# 索引开头 JSON 摘要的固定长度，之后每段占 8 字节（小端），0 表示该段尚无记录
+INDEX_HEADER_SIZE = 512
+OFFSET = struct.Struct('<Q')
+
+
+def paragraph_hash(text):
+    """原文哈希，用于在原文改动后判断哪些已有译文仍然有效"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def source_hash(hashes):
+    """整本书原文的哈希，由各段原文哈希计算"""
+    digest = hashlib.sha256()
+    for value in hashes:
+        digest.update(value.encode('ascii') + b'\n')
+    return digest.hexdigest()[:16]
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def legacy_path(path):
+    """同一本书旧版的 *_progress.json（整个文件重写的格式，可能还保存着 API 密钥）"""
+    return os.path.splitext(path)[0] + '.json'
+
+
+def remove_journal(path):
+    """删除进度日志及其索引，以及同一本书旧版的进度文件"""
+    for name in (path, index_path(path), legacy_path(path)):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def read_journal(path):
+    """重放进度日志，返回 (头部, {段落索引: 记录})
+
+    同一段落出现多次时以最后一次为准；程序崩溃留下的不完整末行会被忽略。
+    """
+    header = {}
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("type") == "header":
+                header = record
+            elif "i" in record:
+                entries[record["i"]] = record
+    return header, entries
+
+
+def _index_header(summary):
+    data = json.dumps(summary, ensure_ascii=False).encode('utf-8')
+    if len(data) >= INDEX_HEADER_SIZE:
+        raise ValueError("索引摘要超出固定长度")
+    return data.ljust(INDEX_HEADER_SIZE - 1) + b'\n'
+
+
+def write_index(path, summary, offsets):
+    """完整重写索引，offsets 为 {段落索引: 字节偏移}"""
+    slots = array('Q', bytes(8 * summary["total_paragraphs"]))
+    for index, offset in offsets.items():
+        if index < len(slots):
+            slots[index] = offset
+    if sys.byteorder == 'big':
+        slots.byteswap()
+    tmp_path = index_path(path) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_index_header(summary))
+        slots.tofile(f)
+    os.replace(tmp_path, index_path(path))
+
+
+def update_index(path, summary, offsets):
+    """原地写入新增的偏移，再更新摘要；摘要最后写，中途崩溃时读者会从旧的日志长度处补读"""
+    with open(index_path(path), 'r+b') as f:
+        for index, offset in offsets.items():
+            if index < summary["total_paragraphs"]:
+                f.seek(INDEX_HEADER_SIZE + OFFSET.size * index)
+                f.write(OFFSET.pack(offset))
+        f.seek(0)
+        f.write(_index_header(summary))
+
+
+def _scan_records(f, start):
+    """从 start 字节处逐行读取日志记录，返回 {段落索引: (偏移, 记录)}；不完整或损坏的行被忽略"""
+    records = {}
+    f.seek(start)
+    offset = start
+    for line in f:
+        if line.endswith(b'\n'):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and "i" in record:
+                records[record["i"]] = (offset, record)
+        offset += len(line)
+    return records
+
+
+def build_index(path):
+    """扫描一遍日志重建索引（旧日志或索引缺失、与日志不一致时）"""
+    with open(path, 'rb') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = {}
+        if not isinstance(header, dict) or header.get("type") != "header":
+            raise ValueError("进度日志缺少头部")
+        records = _scan_records(f, f.tell())
+        size = f.tell()
+    total = max(header.get("total_paragraphs", 0), max(records, default=-1) + 1)
+    summary = {"version": INDEX_VERSION, "journal_id": header.get("journal_id"),
+               "total_paragraphs": total, "source_lang": header.get("source_lang", "unknown"),
+               "source_hash": header.get("source_hash"), "translated": len(records), "journal_size": size}
+    write_index(path, summary, {index: offset for index, (offset, _) in records.items()})
+
+
+class JournalIndex:
+    """通过索引读取进度日志
+
+    摘要只需读取索引开头；日志在上次更新索引后追加的记录（写入中的日志、崩溃前未更新索引的记录）
+    从已索引的长度处补读，不重放整个文件。
+    """
+
+    def __init__(self, path, summary, tail):
+        self.path = path
+        self.summary = summary
+        self.tail = tail
+
+    @classmethod
+    def open(cls, path, rebuild=True):
+        """打开日志的索引；索引缺失或与日志不一致时重建（rebuild 为 False 时返回 None）"""
+        index = cls._load(path)
+        if index is None and rebuild:
+            build_index(path)
+            index = cls._load(path)
+        return index
+
+    @classmethod
+    def _load(cls, path):
+        try:
+            with open(index_path(path), 'rb') as f:
+                summary = json.loads(f.read(INDEX_HEADER_SIZE))
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                # 日志被压缩或替换后 journal_id 会变化，旧索引作废
+                if (summary.get("version") != INDEX_VERSION or header.get("journal_id") != summary["journal_id"]
+                        or os.fstat(f.fileno()).st_size < summary["journal_size"]):
+                    return None
+                tail = _scan_records(f, summary["journal_size"])
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(path, summary, tail)
+
+    def _slots(self, start, stop):
+        with open(index_path(self.path), 'rb') as f:
+            f.seek(INDEX_HEADER_SIZE + OFFSET.size * start)
+            slots = array('Q', f.read(OFFSET.size * (stop - start)))
+        if sys.byteorder == 'big':
+            slots.byteswap()
+        return slots
+
+    def counts(self):
+        """返回 (已完成段落数, 总段落数)"""
+        total = self.summary["total_paragraphs"]
+        done = self.summary["translated"]
+        with open(index_path(self.path), 'rb') as f:
+            for index in self.tail:
+                if index >= total:
+                    continue
+                f.seek(INDEX_HEADER_SIZE + OFFSET.size * index)
+                if OFFSET.unpack(f.read(OFFSET.size))[0] == 0:
+                    done += 1
+        return done, total
+
+    def records(self, start=0, stop=None):
+        """按段落顺序逐条返回 [start, stop) 范围内的 (段落索引, 记录)，只读取这些记录"""
+        total = self.summary["total_paragraphs"]
+        stop = total if stop is None else min(stop, total)
+        start = max(0, start)
+        if start >= stop:
+            return
+        slots = self._slots(start, stop)
+        with open(self.path, 'rb') as f:
+            for index in range(start, stop):
+                if index in self.tail:
+                    yield index, self.tail[index][1]
+                    continue
+                offset = slots[index - start]
+                if offset == 0:
+                    continue
+                f.seek(offset)
+                record = json.loads(f.readline())
+                if record.get("i") != index:
+                    raise ValueError(f"索引与进度日志不一致（第 {index + 1} 段）")
+                yield index, record
+
+
+def _fsync_dir(path):
+    # 让 os.replace 产生的目录项变更也落盘（Windows 不支持打开目录）
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ProgressJournal:
+    """进度日志写入器
+
+    append 只追加一行；每 fsync_every 条或每 fsync_interval 秒 fsync 一次。
+    被覆盖的旧记录多于有效记录时自动压缩。
+    """
+
+    def __init__(self, path, fsync_every=50, fsync_interval=2.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.header = {}
+        self.entries = {}
+        self.file = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.dead_records = 0
+        # 日志当前的字节长度，以及尚未写入索引的 {段落索引: 偏移}
+        self.size = 0
+        self.unindexed = {}
+
+    def start(self, total_paragraphs, source_lang, entries=None, source_hash=None):
+        """以给定的已完成记录开始写入，旧文件会被压缩替换"""
+        self.header = {"type": "header", "version": JOURNAL_VERSION,
+                       "total_paragraphs": total_paragraphs, "source_lang": source_lang,
+                       "source_hash": source_hash}
+        self.entries = dict(entries or {})
+        self.compact()
+
+    def summary(self):
+        """索引开头的摘要"""
+        return {"version": INDEX_VERSION, "journal_id": self.header["journal_id"],
+                "total_paragraphs": self.header["total_paragraphs"], "source_lang": self.header["source_lang"],
+                "source_hash": self.header.get("source_hash"), "translated": len(self.entries),
+                "journal_size": self.size}
+
+    def append(self, index, source_hash, translation, flags=None):
+        """记录一段完成的译文，flags 为质量检查发现的问题"""
+        record = {"i": index, "h": source_hash, "t": translation}
+        if flags:
+            record["q"] = flags
+        if index in self.entries:
+            self.dead_records += 1
+        self.entries[index] = record
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        self.file.write(line)
+        self.unindexed[index] = self.size
+        self.size += len(line.encode('utf-8'))
+        self.unsynced += 1
+        if (self.unsynced >= self.fsync_every or
+                time.monotonic() - self.last_sync >= self.fsync_interval):
+            self.flush()
+        if self.dead_records > max(1000, len(self.entries)):
+            self.compact()
+
+    def flush(self):
+        """把已追加的记录写入磁盘"""
+        if self.file is None or self.file.closed:
+            return
+        self.file.flush()
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        # 日志落盘后再更新索引，索引不会指向不存在的记录
+        if self.unindexed:
+            update_index(self.path, self.summary(), self.unindexed)
+            self.unindexed = {}
+
+    def compact(self):
+        """把头部和每段的最新记录重写到临时文件，再原子替换日志"""
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+        self.header["journal_id"] = os.urandom(16).hex()
+        tmp_path = self.path + '.tmp'
+        offsets = {}
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(self.header, ensure_ascii=False).encode('utf-8') + b'\n')
+            for index in sorted(self.entries):
+                offsets[index] = f.tell()
+                f.write(json.dumps(self.entries[index], ensure_ascii=False).encode('utf-8') + b'\n')
+            self.size = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        write_index(self.path, self.summary(), offsets)
+        self.unindexed = {}
+        self.dead_records = 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.file = open(self.path, 'a', encoding='utf-8', newline='\n')
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class CheckpointWriter:
+    """在后台线程中写进度日志
+
+    append 只把记录放进有界队列，写文件、fsync 和更新索引都在后台线程中进行，不阻塞翻译循环；
+    队列满时 append 等待，积压的记录数有上限。没有新记录时后台线程也会按 fsync_interval 落盘。
+    close 写完队列中的全部记录后 fsync 日志并更新索引，得到最终的检查点。
+    后台写入出错时，之后的 append 和 close 会抛出该异常。
+    """
+
+    _STOP = object()
+
+    def __init__(self, journal, maxsize=1024):
+        self.journal = journal
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        # closed：不再接受新记录；finished：后台线程已结束且日志已关闭（最终检查点已落盘）
+        self.closed = False
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.journal.fsync_interval)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                return
+            if self.error is not None:
+                # 出错后继续取出记录，避免 append 一直等待
+                continue
+            try:
+                if item is None:
+                    self.journal.flush()
+                else:
+                    self.journal.append(*item)
+            except Exception as e:
+                self.error = e
+
+    def append(self, index, source_hash, translation, flags=None):
+        if self.error is not None:
+            raise self.error
+        if self.closed:
+            raise ValueError("进度日志已关闭")
+        self.queue.put((index, source_hash, translation, flags))
+
+    def close(self):
+        """写完队列中的记录并落盘，可重复调用
+
+        等待后台线程时被中断（如再次按 Ctrl+C）的话，下一次调用 close 会继续等待并写下最终检查点。
+        """
+        if not self.closed:
+            self.queue.put(self._STOP)
+            self.closed = True
+        if not self.finished:
+            self.thread.join()
+            if self.error is None:
+                try:
+                    self.journal.close()
+                except OSError as e:
+                    self.error = e
+            self.finished = True
+        if self.error is not None:
+            raise self.error
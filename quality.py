@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+译文质量检查
+翻译结束后逐段检查译文，标记失败或可疑的段落：
+- identical: 译文与原文相同（模型原样返回了原文）
+- script: 原文有足够多的西文字母，译文中汉字却很少（没有译成中文）
+- ratio: 译文与原文的长度比远离全书的中位数（漏译了一部分，或多出了无关内容）
+- truncated: 原文以句末标点结束，译文却停在文字或逗号上（回复被截断）
+
+标记随译文一起保存在进度日志中（记录的 "q" 字段），
+之后用 translate_md_to_epub.py --retranslate-flagged 只重新翻译这些段落。
+误报的段落可以接受（记录的 "a" 字段），之后不再检查，直到该段被重新翻译或原文改变。
+
+用法：python quality.py <input.md> [progress.jsonl] [--show 10]  检查已翻译的段落，不修改进度文件
+      python quality.py <input.md> [progress.jsonl] --accept 12,40   接受第 12、40 段的译文
+      python quality.py <input.md> [progress.jsonl] --accept-all     接受所有被标记的译文
+"""
+
+import argparse
+import os
+import re
+import statistics
+import sys
+
+from md_stream import read_paragraphs
+from progress_journal import ProgressJournal, paragraph_hash, read_journal
+from translation_cache import normalize_text
+
+REASONS = {"identical": "与原文相同", "script": "不是中文", "ratio": "长度比异常", "truncated": "疑似截断"}
+
+# 原文至少有这么多西文字母时才检查 identical 和 script，页码、编号等短段落原样保留是正常的
+MIN_LETTERS = 20
+# 译文中汉字占（汉字 + 西文字母）的比例低于该值视为没有译成中文
+MIN_HAN_SHARE = 0.3
+# 原文不少于该长度的段落才参与长度比的统计和检查
+RATIO_MIN_CHARS = 50
+# 长度比超出中位数的这个倍数（或低于中位数除以该倍数）视为异常
+RATIO_SPREAD = 3.0
+# 参与统计的段落少于该数时使用默认的中位数（西文译成中文约为原文长度的三分之一）
+RATIO_MIN_SAMPLES = 20
+DEFAULT_RATIO = 0.35
+
+HAN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]')
+LATIN_PATTERN = re.compile(r'[A-Za-zÀ-ÖØ-öø-ÿ]')
+# 至少有 MIN_LETTERS 个西文字母，找到足够的字母就停止，不必数完整段
+ENOUGH_LETTERS_PATTERN = re.compile(r'(?:[^A-Za-zÀ-ÖØ-öø-ÿ]*[A-Za-zÀ-ÖØ-öø-ÿ]){%d}' % MIN_LETTERS)
+SENTENCE_END_PATTERN = re.compile(r'[.!?…»"”’)\]]$')
+
+
+def length_ratio(source, translation):
+    return len(translation) / len(source)
+
+
+def median_ratio(pairs):
+    """全书译文与原文长度比的中位数，pairs 为 [(原文, 译文)]"""
+    ratios = [length_ratio(source, translation) for source, translation in pairs
+              if len(source) >= RATIO_MIN_CHARS]
+    if len(ratios) < RATIO_MIN_SAMPLES:
+        return DEFAULT_RATIO
+    return statistics.median(ratios)
+
+
+def check(source, translation, median=DEFAULT_RATIO):
+    """返回一段译文的问题列表（REASONS 中的键），没有问题时返回空列表"""
+    reasons = []
+    if ENOUGH_LETTERS_PATTERN.match(source):
+        # 正常的中文译文西文字母很少，不可能与原文相同，省去规范化；没有西文字母时也不必统计汉字
+        latin = len(LATIN_PATTERN.findall(translation))
+        if latin >= MIN_LETTERS and normalize_text(translation) == normalize_text(source):
+            # 与原文相同时其余检查没有意义
+            return ["identical"]
+        han = len(HAN_PATTERN.findall(translation)) if latin else 0
+        if han < MIN_HAN_SHARE * (han + latin):
+            reasons.append("script")
+    if len(source) >= RATIO_MIN_CHARS:
+        ratio = length_ratio(source, translation)
+        if ratio < median / RATIO_SPREAD or ratio > median * RATIO_SPREAD:
+            reasons.append("ratio")
+    end = translation.rstrip()[-1:]
+    if SENTENCE_END_PATTERN.search(source.rstrip()) and end and (end.isalnum() or end in "，,、"):
+        reasons.append("truncated")
+    return reasons
+
+
+def check_translations(paragraphs, translated, skip=()):
+    """检查所有已翻译的段落，translated 为 {段落索引: 译文}，返回 {段落索引: 问题列表}，只包含有问题的段落
+
+    skip 中的段落（用户已接受的译文）不检查，但仍参与长度比中位数的统计。
+    """
+    median = median_ratio((paragraphs[i], text) for i, text in translated.items())
+    flags = {}
+    for i in sorted(translated):
+        if i in skip:
+            continue
+        reasons = check(paragraphs[i], translated[i], median)
+        if reasons:
+            flags[i] = reasons
+    return flags
+
+
+def describe(flags):
+    """按问题种类统计，如 "与原文相同 3 段，疑似截断 1 段" """
+    counts = {}
+    for reasons in flags.values():
+        for reason in reasons:
+            counts[reason] = counts.get(reason, 0) + 1
+    return "，".join(f"{REASONS[reason]} {counts[reason]} 段" for reason in REASONS if reason in counts)
+
+
+def accept(progress_file, header, entries, indices):
+    """把 indices 中段落的译文标记为已接受并去掉质量标记，重写进度日志"""
+    for i in indices:
+        entries[i].pop("q", None)
+        entries[i]["a"] = True
+    journal = ProgressJournal(progress_file)
+    journal.start(header.get("total_paragraphs", 0), header.get("source_lang", ""), entries,
+                  header.get("source_hash"))
+    journal.close()
+
+
+def parse_numbers(value):
+    """"12,40" -> [11, 39]，命令行中的段落编号从 1 开始"""
+    try:
+        return [int(n) - 1 for n in value.split(',') if n.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"段落编号应为逗号分隔的整数: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查进度文件中的译文，列出失败或可疑的段落")
+    parser.add_argument("input_md", help="原文 Markdown 文件")
+    parser.add_argument("progress_file", nargs="?", help="进度文件 (默认: <输入文件名>_progress.jsonl)")
+    parser.add_argument("--show", type=int, default=10, help="显示前几段有问题的译文 (默认: 10)")
+    parser.add_argument("--accept", type=parse_numbers, metavar="N[,M...]",
+                        help="接受这些段落（编号从 1 开始）的译文，之后不再标记，也不会被 --retranslate-flagged 重新翻译")
+    parser.add_argument("--accept-all", action="store_true", help="接受所有被标记的译文")
+    args = parser.parse_args()
+
+    progress_file = args.progress_file or f"{os.path.splitext(args.input_md)[0]}_progress.jsonl"
+    if not os.path.exists(progress_file):
+        print(f"错误：进度文件 {progress_file} 不存在")
+        sys.exit(1)
+    paragraphs = list(read_paragraphs(args.input_md))
+    header, entries = read_journal(progress_file)
+    # 原文已改动的段落不检查
+    translated = {i: record["t"] for i, record in entries.items()
+                  if i < len(paragraphs) and record.get("h") == paragraph_hash(paragraphs[i])}
+    accepted = {i for i in translated if entries[i].get("a")}
+    flags = check_translations(paragraphs, translated, skip=accepted)
+
+    if args.accept is not None or args.accept_all:
+        indices = sorted(flags) if args.accept_all else args.accept
+        unknown = [i + 1 for i in indices if i not in translated]
+        if unknown:
+            print(f"错误：第 {', '.join(map(str, unknown))} 段没有可接受的译文")
+            sys.exit(1)
+        accept(progress_file, header, entries, indices)
+        print(f"已接受 {len(indices)} 段译文，进度文件: {progress_file}")
+        return
+
+    missing = len(paragraphs) - len(translated)
+    print(f"段落数: {len(paragraphs)}，已翻译: {len(translated)}，未翻译: {missing}，有问题: {len(flags)}"
+          + (f"（{describe(flags)}）" if flags else "") + (f"，已接受: {len(accepted)}" if accepted else ""))
+    for i in list(flags)[:args.show]:
+        print(f"  第 {i + 1} 段 [{', '.join(REASONS[reason] for reason in flags[i])}]")
+        print(f"    原文: {paragraphs[i][:80]!r}")
+        print(f"    译文: {translated[i][:80]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,28 +5,18 @@
 将markdown文件中的段落缩减到指定数量
 """
 
+import argparse
+import math
 import re
 import sys
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 
-def read_markdown_file(filename: str) -> str:
-    """读取markdown文件"""
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        print(f"错误：找不到文件 {filename}")
-        sys.exit(1)
-    except UnicodeDecodeError:
-        print(f"错误：无法解码文件 {filename}，请检查文件编码")
-        sys.exit(1)
+from md_stream import ParagraphWriter, read_paragraphs
+from tokens import estimate_tokens
 
-def split_into_paragraphs(content: str) -> List[str]:
-    """将内容分割成段落"""
-    # 使用双换行符分割段落
-    paragraphs = re.split(r'\n\s*\n', content.strip())
-    # 过滤空段落
-    return [p.strip() for p in paragraphs if p.strip()]
+# 标题和列表（无序或有序）段落
+TITLE_PATTERN = re.compile(r'^#+\s+')
+LIST_PATTERN = re.compile(r'^(?:[\-\*\+]|\d+[.)])\s+')
 
 def merge_paragraphs(paragraphs: List[str], target_count: int) -> List[str]:
     """将段落合并到目标数量"""
@@ -62,107 +52,142 @@ def merge_paragraphs(paragraphs: List[str], target_count: int) -> List[str]:
     
     return merged_paragraphs
 
+def is_structural(paragraph: str) -> bool:
+    """标题和列表段落保持原样，不与其他段落合并"""
+    return bool(TITLE_PATTERN.match(paragraph) or LIST_PATTERN.match(paragraph))
+
+def regular_runs(paragraphs: List[str]) -> List[Tuple[bool, List[str]]]:
+    """把段落切成 (是否为结构段落, 段落列表) 的连续片段，常规段落只在片段内部合并"""
+    runs = []
+    for para in paragraphs:
+        structural = is_structural(para)
+        if runs and not structural and not runs[-1][0]:
+            runs[-1][1].append(para)
+        else:
+            runs.append((structural, [para]))
+    return runs
+
+def allocate_slots(sizes: List[int], slots: int) -> List[int]:
+    """按段落数比例把 slots 个名额分给各片段，每个片段至少 1 个、至多为自身段落数"""
+    allocation = [1] * len(sizes)
+    remaining = slots - len(sizes)
+    if remaining <= 0:
+        return allocation
+    total = sum(sizes)
+    shares = [remaining * size / total for size in sizes]
+    for n, share in enumerate(shares):
+        allocation[n] = min(sizes[n], allocation[n] + int(share))
+    # 余下的名额按小数部分从大到小分配
+    leftover = slots - sum(allocation)
+    for n in sorted(range(len(sizes)), key=lambda n: shares[n] - int(shares[n]), reverse=True):
+        if leftover <= 0:
+            break
+        if allocation[n] < sizes[n]:
+            allocation[n] += 1
+            leftover -= 1
+    return allocation
+
 def preserve_structure(paragraphs: List[str], target_count: int) -> List[str]:
-    """保持文档结构，智能合并段落"""
+    """保持文档结构，智能合并段落
+
+    标题和列表原样保留，常规段落只与相邻的常规段落合并，输出顺序与原文一致。
+    名额按各片段的段落数分配；片段数多于可用名额时每个片段至少保留一段，结果可能略多于目标数。
+    """
     if len(paragraphs) <= target_count:
         return paragraphs
     
-    # 识别标题和特殊段落
-    title_pattern = re.compile(r'^#+\s+', re.MULTILINE)
-    list_pattern = re.compile(r'^[\-\*\+]\s+', re.MULTILINE)
-    
-    # 分类段落
-    titles = []
-    lists = []
-    regular_paragraphs = []
-    
-    for i, para in enumerate(paragraphs):
-        if title_pattern.match(para):
-            titles.append((i, para))
-        elif list_pattern.match(para):
-            lists.append((i, para))
-        else:
-            regular_paragraphs.append((i, para))
+    runs = regular_runs(paragraphs)
+    structural_count = sum(len(run) for structural, run in runs if structural)
     
     # 计算需要保留的常规段落数量
-    available_slots = target_count - len(titles) - len(lists)
+    available_slots = target_count - structural_count
     
     if available_slots <= 0:
         # 如果标题和列表太多，需要合并一些
         return merge_paragraphs(paragraphs, target_count)
     
-    # 合并常规段落
-    if len(regular_paragraphs) > available_slots:
-        regular_texts = [p[1] for p in regular_paragraphs]
-        merged_regular = merge_paragraphs(regular_texts, available_slots)
-        
-        # 重新构建段落列表
-        result = []
-        title_idx = 0
-        list_idx = 0
-        regular_idx = 0
-        
-        for i in range(len(paragraphs)):
-            if title_idx < len(titles) and titles[title_idx][0] == i:
-                result.append(titles[title_idx][1])
-                title_idx += 1
-            elif list_idx < len(lists) and lists[list_idx][0] == i:
-                result.append(lists[list_idx][1])
-                list_idx += 1
-            elif regular_idx < len(merged_regular):
-                result.append(merged_regular[regular_idx])
-                regular_idx += 1
-                # 跳过原始段落中对应的常规段落
-                while (regular_idx < len(regular_paragraphs) and 
-                       regular_paragraphs[regular_idx][0] < len(paragraphs) and
-                       regular_paragraphs[regular_idx][0] <= i + 1):
-                    regular_idx += 1
-        
-        return result
-    else:
+    regular = [run for structural, run in runs if not structural]
+    if sum(len(run) for run in regular) <= available_slots:
         return paragraphs
+    
+    allocation = iter(allocate_slots([len(run) for run in regular], available_slots))
+    result = []
+    for structural, run in runs:
+        if structural:
+            result.extend(run)
+        else:
+            result.extend(merge_paragraphs(run, next(allocation)))
+    return result
 
-def write_markdown_file(filename: str, content: str):
-    """写入markdown文件"""
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(content)
-        print(f"已成功写入文件：{filename}")
-    except Exception as e:
-        print(f"写入文件时出错：{e}")
-        sys.exit(1)
+def regroup_by_tokens(paragraphs: Iterable[str], target_tokens: int) -> Iterator[str]:
+    """按 token 预算重新分组：把相邻的常规段落打包成接近 target_tokens 的组
+
+    标题和列表段落单独成组，分组不会跨越它们；超过预算的单个段落也单独成组。
+    为避免末尾出现很小的组，每组达到 (片段总量 / 组数) 后就开始新组。
+    """
+    for structural, run in regular_runs(paragraphs):
+        if structural:
+            yield from run
+            continue
+        tokens = [estimate_tokens(para) for para in run]
+        groups = max(1, math.ceil(sum(tokens) / target_tokens))
+        goal = sum(tokens) / groups
+        group, group_tokens = [], 0
+        for para, count in zip(run, tokens):
+            if group and (group_tokens + count > target_tokens or group_tokens >= goal):
+                yield '\n\n'.join(group)
+                group, group_tokens = [], 0
+            group.append(para)
+            group_tokens += count
+        if group:
+            yield '\n\n'.join(group)
 
 def main():
     """主函数"""
-    if len(sys.argv) < 2:
-        print("用法：python reduce_paragraphs.py <输入文件> [目标段落数] [输出文件]")
-        print("示例：python reduce_paragraphs.py book_merged.md 10 book_reduced.md")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    target_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
-    output_file = sys.argv[3] if len(sys.argv) > 3 else f"{input_file.rsplit('.', 1)[0]}_reduced.md"
+    parser = argparse.ArgumentParser(
+        description="缩减Markdown段落数量，保持标题和列表结构",
+        epilog="示例：python reduce_paragraphs.py book_merged.md 10 book_reduced.md")
+    parser.add_argument("input_file", help="输入文件")
+    parser.add_argument("target_count", nargs="?", type=int, default=10, help="目标段落数 (默认: 10)")
+    parser.add_argument("output_file", nargs="?", help="输出文件 (默认: <输入文件名>_reduced.md)")
+    parser.add_argument("--tokens", type=int,
+                        help="改为按 token 预算分组：相邻段落打包到接近该 token 数，忽略目标段落数")
+    args = parser.parse_args()
+    
+    input_file = args.input_file
+    target_count = args.target_count
+    output_file = args.output_file or f"{input_file.rsplit('.', 1)[0]}_reduced.md"
     
     print(f"正在处理文件：{input_file}")
-    print(f"目标段落数：{target_count}")
+    if args.tokens:
+        print(f"每组目标 token 数：{args.tokens}")
+    else:
+        print(f"目标段落数：{target_count}")
     print(f"输出文件：{output_file}")
     
-    # 读取文件
-    content = read_markdown_file(input_file)
-    
-    # 分割段落
-    paragraphs = split_into_paragraphs(content)
+    # 逐段读取，不再保留整个文件内容
+    try:
+        paragraphs = list(read_paragraphs(input_file))
+    except UnicodeDecodeError:
+        print(f"错误：无法解码文件 {input_file}，请检查文件编码")
+        sys.exit(1)
     print(f"原始段落数：{len(paragraphs)}")
     
     # 缩减段落
-    reduced_paragraphs = preserve_structure(paragraphs, target_count)
+    if args.tokens:
+        reduced_paragraphs = list(regroup_by_tokens(paragraphs, args.tokens))
+    else:
+        reduced_paragraphs = preserve_structure(paragraphs, target_count)
     print(f"缩减后段落数：{len(reduced_paragraphs)}")
     
-    # 合并段落
-    final_content = '\n\n'.join(reduced_paragraphs)
-    
-    # 写入文件
-    write_markdown_file(output_file, final_content)
+    # 逐段写入文件
+    try:
+        with ParagraphWriter(output_file) as writer:
+            writer.write_all(reduced_paragraphs)
+        print(f"已成功写入文件：{output_file}")
+    except Exception as e:
+        print(f"写入文件时出错：{e}")
+        sys.exit(1)
     
     print("段落缩减完成！")
 
@@ -0,0 +1,215 @@
+"""
+运行统计与报告
+记录每次请求的耗时、重试、排队时间、API 返回的 token 用量、各阶段耗时和吞吐量，
+可估算剩余时间，并输出为 JSON 运行报告
+"""
+
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# 请求耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RunStats:
+    """线程安全的运行统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.started_monotonic = time.monotonic()
+        self.latencies = []
+        self.queue_waits = []
+        self.first_tokens = []
+        self.status_counts = {}
+        self.retries = 0
+        self.retry_reasons = {}
+        self.failures = 0
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0,
+                      "prompt_cache_hit_tokens": 0, "prompt_cache_miss_tokens": 0}
+        self.paragraphs_done = 0
+        self.paragraphs_total = 0
+        # 本次运行翻译完成的段落数，不含从进度文件恢复的段落
+        self.paragraphs_translated = 0
+        self.stages = {}
+        self.dedup = {"paragraphs_saved": 0, "requests_saved": 0, "retranslated": 0}
+        # 质量检查标记的段落数，按问题种类统计
+        self.quality = {"flagged": 0, "reasons": {}}
+        # 最近完成的 (时间, 累计段落数)，用于按近期速度估算剩余时间
+        self.recent = []
+
+    def record_request(self, latency, status):
+        """记录一次 HTTP 请求（每次重试单独记录），status 为状态码或 "error" """
+        with self.lock:
+            self.latencies.append(latency)
+            self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+
+    def record_first_token(self, seconds):
+        """记录流式响应从发出请求到收到第一段内容的时间"""
+        with self.lock:
+            self.first_tokens.append(seconds)
+
+    def record_retry(self, reason):
+        with self.lock:
+            self.retries += 1
+            self.retry_reasons[reason] = self.retry_reasons.get(reason, 0) + 1
+
+    def record_failure(self):
+        """记录一次重试耗尽的请求"""
+        with self.lock:
+            self.failures += 1
+
+    def record_usage(self, usage):
+        """累加响应中的 usage 字段"""
+        if not usage:
+            return
+        with self.lock:
+            for name in self.usage:
+                self.usage[name] += usage.get(name) or 0
+
+    def record_queue_wait(self, seconds):
+        """记录批次从提交到开始请求前的排队时间"""
+        with self.lock:
+            self.queue_waits.append(seconds)
+
+    def record_dedup(self, paragraphs_saved=0, requests_saved=0, retranslated=0):
+        """记录去重省下的段落数和请求数，retranslated 为无法直接复用译文、改为单独翻译的重复段落数"""
+        with self.lock:
+            self.dedup["paragraphs_saved"] += paragraphs_saved
+            self.dedup["requests_saved"] += requests_saved
+            self.dedup["retranslated"] += retranslated
+
+    def record_quality(self, flags):
+        """记录质量检查的结果，flags 为 {段落索引: 问题列表}"""
+        with self.lock:
+            self.quality["flagged"] += len(flags)
+            for reasons in flags.values():
+                for reason in reasons:
+                    self.quality["reasons"][reason] = self.quality["reasons"].get(reason, 0) + 1
+
+    def set_total(self, total, done=0):
+        with self.lock:
+            self.paragraphs_total = total
+            self.paragraphs_done = done
+            self.recent = [(time.monotonic(), done)]
+
+    def record_paragraphs(self, count):
+        with self.lock:
+            self.paragraphs_done += count
+            self.paragraphs_translated += count
+            self.recent.append((time.monotonic(), self.paragraphs_done))
+            if len(self.recent) > 50:
+                del self.recent[0]
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个处理阶段的耗时"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - start
+
+    def throughput(self):
+        """近期速度（段落/秒）"""
+        with self.lock:
+            if len(self.recent) < 2:
+                return 0.0
+            (t0, n0), (t1, n1) = self.recent[0], self.recent[-1]
+            return (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+
+    def eta(self):
+        """按近期速度估算剩余秒数，无法估算时返回 None"""
+        rate = self.throughput()
+        if rate <= 0:
+            return None
+        return max(0, self.paragraphs_total - self.paragraphs_done) / rate
+
+    def progress_line(self):
+        """实时进度的一行摘要"""
+        done, total = self.paragraphs_done, self.paragraphs_total
+        percent = done * 100 // total if total else 100
+        line = f"{done}/{total} ({percent}%)，{self.throughput():.2f} 段/秒"
+        eta = self.eta()
+        if eta is not None:
+            line += f"，预计剩余 {format_seconds(eta)}"
+        return line
+
+    def report(self):
+        """生成运行报告（可直接序列化为 JSON）"""
+        with self.lock:
+            elapsed = time.monotonic() - self.started_monotonic
+            latencies = sorted(self.latencies)
+            # 累计直方图：每个桶记录耗时不超过上界的请求数
+            histogram = {f"le_{bound}": bisect.bisect_right(latencies, bound) for bound in LATENCY_BUCKETS}
+            histogram["le_inf"] = len(latencies)
+            queue_waits = sorted(self.queue_waits)
+            first_tokens = sorted(self.first_tokens)
+            total_tokens = self.usage["prompt_tokens"] + self.usage["completion_tokens"]
+            return {
+                "started_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                "elapsed_seconds": round(elapsed, 3),
+                "paragraphs": {"done": self.paragraphs_done, "total": self.paragraphs_total,
+                               "translated_this_run": self.paragraphs_translated},
+                "requests": {
+                    "count": len(latencies),
+                    "status": dict(self.status_counts),
+                    "retries": self.retries,
+                    "retry_reasons": dict(self.retry_reasons),
+                    "failures": self.failures,
+                    "latency_seconds": {
+                        "p50": percentile(latencies, 0.5),
+                        "p90": percentile(latencies, 0.9),
+                        "p99": percentile(latencies, 0.99),
+                        "max": latencies[-1] if latencies else None,
+                        "mean": sum(latencies) / len(latencies) if latencies else None,
+                        "histogram": histogram
+                    },
+                    "queue_wait_seconds": {
+                        "p50": percentile(queue_waits, 0.5),
+                        "p90": percentile(queue_waits, 0.9),
+                        "max": queue_waits[-1] if queue_waits else None
+                    },
+                    "first_token_seconds": {
+                        "p50": percentile(first_tokens, 0.5),
+                        "p90": percentile(first_tokens, 0.9),
+                        "max": first_tokens[-1] if first_tokens else None
+                    }
+                },
+                "tokens": dict(self.usage, total_tokens=total_tokens),
+                "dedup": dict(self.dedup),
+                "quality": {"flagged": self.quality["flagged"], "reasons": dict(self.quality["reasons"])},
+                "throughput": {
+                    "paragraphs_per_second": self.paragraphs_translated / elapsed if elapsed else 0.0,
+                    "tokens_per_second": total_tokens / elapsed if elapsed else 0.0
+                },
+                "stages_seconds": {name: round(seconds, 3) for name, seconds in self.stages.items()}
+            }
+
+    def write(self, path):
+        """把运行报告写入 JSON 文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        print(f"运行报告已保存到: {path}")
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}小时{minutes}分"
+    if minutes:
+        return f"{minutes}分{seconds}秒"
+    return f"{seconds}秒"
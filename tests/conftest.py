@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_backend import MockBackend, make_server
+
+
+class ScriptedBackend(MockBackend):
+    """先按顺序返回 script 中预设的响应（None 表示停滞），用完后与 MockBackend 相同"""
+
+    def __init__(self, script=(), **kwargs):
+        super().__init__(**kwargs)
+        self.script = list(script)
+        self.received = 0
+
+    def respond(self, payload):
+        with self.lock:
+            self.received += 1
+            if self.script:
+                return self.script.pop(0)
+        return super().respond(payload)
+
+
+@pytest.fixture
+def mock_server():
+    """在后台线程中运行模拟后端，返回 start(backend) -> 接口地址"""
+    servers = []
+
+    def start(backend):
+        server = make_server(backend, 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from translate_md_to_epub import BATCH_MARKER, split_batch_response
+
+
+def batch(*numbers):
+    return '\n\n'.join(f"{BATCH_MARKER.format(n)}\n译文{n}" for n in numbers)
+
+
+def test_splits_in_order():
+    assert split_batch_response(batch(1, 2, 3), 3) == ["译文1", "译文2", "译文3"]
+
+
+def test_rejects_missing_number():
+    assert split_batch_response(batch(1, 3), 3) is None
+    assert split_batch_response(batch(1, 2), 3) is None
+
+
+def test_rejects_extra_number():
+    assert split_batch_response(batch(1, 2, 3, 4), 3) is None
+    assert split_batch_response(batch(1, 2, 2, 3), 3) is None
+
+
+def test_rejects_wrong_order():
+    assert split_batch_response(batch(2, 1, 3), 3) is None
+
+
+def test_rejects_text_before_first_marker_or_empty_translation():
+    assert split_batch_response("以下是译文\n\n" + batch(1, 2), 2) is None
+    assert split_batch_response(f"{BATCH_MARKER.format(1)}\n\n{BATCH_MARKER.format(2)}\n译文2", 2) is None
+
+
+def test_marker_inside_line_is_not_a_separator():
+    content = f"{BATCH_MARKER.format(1)}\n见 {BATCH_MARKER.format(2)} 之后\n\n{BATCH_MARKER.format(2)}\n译文2"
+    assert split_batch_response(content, 2) == [f"见 {BATCH_MARKER.format(2)} 之后", "译文2"]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from clean_md import clean_chunks, clean_markdown, clean_text, parallel_clean_chunks
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def read(name):
+    with open(os.path.join(DATA, name), 'r', encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+# clean_expected.md 是最初的整文件正则实现对 clean_input.md 的输出，流式和并行清理必须与它逐字节一致
+SOURCE = read("clean_input.md")
+EXPECTED = read("clean_expected.md")
+
+
+def chunked(text, size):
+    return [text[n:n + size] for n in range(0, len(text), size)]
+
+
+def test_clean_text_matches_golden():
+    assert clean_text(SOURCE) == EXPECTED
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_chunk_boundaries_do_not_change_output(size):
+    assert ''.join(clean_chunks(chunked(SOURCE, size))) == EXPECTED
+
+
+@pytest.mark.parametrize("shard_size", [1, 16, 100])
+def test_parallel_clean_matches_golden(shard_size):
+    assert ''.join(parallel_clean_chunks(chunked(SOURCE, 5), workers=2, shard_size=shard_size)) == EXPECTED
+
+
+def test_clean_markdown_file_matches_golden(tmp_path, capsys):
+    output = tmp_path / "book_clean.md"
+    clean_markdown(os.path.join(DATA, "clean_input.md"), str(output), workers=1, shard_size=32)
+    assert output.read_bytes() == EXPECTED.encode('utf-8')
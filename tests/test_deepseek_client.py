@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from conftest import ScriptedBackend
+from deepseek_client import DeepSeekClient, TokenBucket, TranslationError
+from mock_backend import fake_translate
+from translate_md_to_epub import chat_completion
+
+RATE_LIMITED = (429, {"Retry-After": "0"}, b'{"error": "rate limited"}')
+SERVER_ERROR = (503, {}, b'{"error": "unavailable"}')
+# 网关返回的 HTML 错误页，状态码却是 200
+NOT_JSON = (200, {"Content-Type": "text/html"}, b'<html>502 Bad Gateway</html>')
+TRANSLATION = fake_translate("Hello.")
+
+
+def make_client(url, **kwargs):
+    options = dict(max_retries=3, rate_limit=1000, backoff_base=0.001)
+    options.update(kwargs)
+    return DeepSeekClient("test", api_url=url, **options)
+
+
+@pytest.mark.parametrize("failure", [RATE_LIMITED, SERVER_ERROR, NOT_JSON], ids=["429", "5xx", "200-not-json"])
+def test_retries_transient_failures(mock_server, failure):
+    backend = ScriptedBackend([failure, failure])
+    client = make_client(mock_server(backend))
+    try:
+        assert chat_completion("Hello.", client, "en") == TRANSLATION
+    finally:
+        client.close()
+    assert backend.received == 3
+
+
+def test_gives_up_after_max_retries(mock_server):
+    backend = ScriptedBackend([SERVER_ERROR] * 3)
+    client = make_client(mock_server(backend), max_retries=2)
+    try:
+        with pytest.raises(TranslationError):
+            chat_completion("Hello.", client, "en")
+    finally:
+        client.close()
+    assert backend.received == 3
+
+
+def test_does_not_retry_client_errors(mock_server):
+    backend = ScriptedBackend([(401, {}, b'{"error": "invalid key"}')])
+    client = make_client(mock_server(backend))
+    try:
+        with pytest.raises(TranslationError):
+            chat_completion("Hello.", client, "en")
+    finally:
+        client.close()
+    assert backend.received == 1
+
+
+def test_stream_idle_timeout_retries(mock_server):
+    # 第一次请求停滞不返回任何数据，超过 idle_timeout 后应重试而不是等待整个读取超时
+    backend = ScriptedBackend([None])
+    client = make_client(mock_server(backend), stream=True, idle_timeout=0.3)
+    try:
+        assert chat_completion("Hello.", client, "en") == TRANSLATION
+    finally:
+        client.close()
+    assert backend.received == 2
+
+
+@pytest.mark.parametrize("rate", [0, -1])
+def test_rejects_non_positive_rate_limit(rate):
+    with pytest.raises(ValueError):
+        TokenBucket(rate)
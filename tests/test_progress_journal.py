@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+
+from progress_journal import (JournalIndex, ProgressJournal, index_path, paragraph_hash, read_journal,
+                              remove_journal, source_hash)
+
+PARAGRAPHS = [f"Paragraph {n}." for n in range(10)]
+HASHES = [paragraph_hash(text) for text in PARAGRAPHS]
+
+
+def write_journal(path, indices, fsync_every=50):
+    journal = ProgressJournal(path, fsync_every=fsync_every)
+    journal.start(len(PARAGRAPHS), "en", source_hash=source_hash(HASHES))
+    for i in indices:
+        journal.append(i, HASHES[i], f"译文 {i}", flags=["untranslated"] if i == 3 else None)
+    journal.close()
+    return journal
+
+
+def test_journal_and_index_round_trip(tmp_path):
+    path = str(tmp_path / "book_progress.jsonl")
+    write_journal(path, [0, 3, 5, 9], fsync_every=2)
+
+    header, entries = read_journal(path)
+    assert header["total_paragraphs"] == 10
+    assert header["source_hash"] == source_hash(HASHES)
+    assert sorted(entries) == [0, 3, 5, 9]
+    assert entries[3]["q"] == ["untranslated"]
+
+    index = JournalIndex.open(path, rebuild=False)
+    assert index is not None
+    assert index.counts() == (4, 10)
+    assert list(index.records()) == [(i, entries[i]) for i in (0, 3, 5, 9)]
+    assert [i for i, _ in index.records(3, 6)] == [3, 5]
+
+
+def test_index_reads_records_appended_after_last_update(tmp_path):
+    path = str(tmp_path / "book_progress.jsonl")
+    journal = ProgressJournal(path, fsync_every=1000, fsync_interval=1000)
+    journal.start(len(PARAGRAPHS), "en")
+    journal.append(1, HASHES[1], "译文 1")
+    journal.append(1, HASHES[1], "新译文 1")
+    journal.append(2, HASHES[2], "译文 2")
+    journal.file.flush()
+
+    # 索引尚未更新，新增记录从已索引的日志长度处补读；同一段以最后一次为准
+    index = JournalIndex.open(path, rebuild=False)
+    assert index.counts() == (2, 10)
+    assert [(i, record["t"]) for i, record in index.records()] == [(1, "新译文 1"), (2, "译文 2")]
+    journal.close()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "book_progress.jsonl")
+    write_journal(path, [0, 1])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"i": 2, "h": "torn')
+
+    _, entries = read_journal(path)
+    assert sorted(entries) == [0, 1]
+    index = JournalIndex.open(path)
+    assert [i for i, _ in index.records()] == [0, 1]
+
+
+def test_missing_or_stale_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / "book_progress.jsonl")
+    write_journal(path, [4, 7])
+    os.remove(index_path(path))
+    assert JournalIndex.open(path, rebuild=False) is None
+    assert [i for i, _ in JournalIndex.open(path).records()] == [4, 7]
+
+    # 重新开始写入会压缩替换日志，旧索引对应的 journal_id 作废
+    stale = index_path(path) + '.old'
+    os.replace(index_path(path), stale)
+    write_journal(path, [4])
+    os.replace(stale, index_path(path))
+    assert JournalIndex.open(path, rebuild=False) is None
+    assert [i for i, _ in JournalIndex.open(path).records()] == [4]
+
+
+def test_remove_journal_deletes_index_and_legacy_file(tmp_path):
+    path = str(tmp_path / "book_progress.jsonl")
+    write_journal(path, [0])
+    legacy = str(tmp_path / "book_progress.json")
+    with open(legacy, 'w', encoding='utf-8') as f:
+        f.write('{}')
+
+    remove_journal(path)
+    assert not any(os.path.exists(name) for name in (path, index_path(path), legacy))
@@ -0,0 +1,16 @@
+"""
+Token 数量估算
+不依赖分词器，按 DeepSeek 官方给出的经验比例估算：
+1 个中文字符约 0.6 个 token，1 个英文字符约 0.3 个 token
+"""
+
+import math
+import re
+
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """估算文本的 token 数量"""
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return math.ceil(cjk_count * 0.6 + (len(text) - cjk_count) * 0.3)
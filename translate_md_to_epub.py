@@ -1,38 +1,177 @@
-import requests
-from ebooklib import epub
-import markdown
 import sys
 import os
 import json
 import signal
+import argparse
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dedup import DEFAULT_THRESHOLD as DEFAULT_DEDUP_THRESHOLD, DedupPlan
+from deepseek_client import DEFAULT_API_URL, DeepSeekClient, TranslationError, TruncatedResponse
+from clean_md import parallel_clean_chunks
+from epub_builder import DEFAULT_CHAPTER_LEVEL, build_epub, chapter_cache_dir
+from glossary import DEFAULT_MIN_COUNT, Glossary, extract_terms, glossary_path, save_glossary
+from md_stream import iter_chunks, iter_paragraphs, read_paragraphs, split_lines
+from progress_journal import (CheckpointWriter, ProgressJournal, legacy_path, paragraph_hash, read_journal,
+                              remove_journal, source_hash)
+from quality import check_translations, describe
+from run_report import RunStats, format_seconds
+from tokens import estimate_tokens
+from translation_cache import DEFAULT_CACHE_MAX_MB, DEFAULT_CACHE_PATH, RefreshCache, TranslationCache, make_key
+
+# 默认同时进行的翻译请求数
+DEFAULT_CONCURRENCY = 4
+
+# 默认每个请求打包的原文 token 预算，0 表示逐段翻译
+DEFAULT_BATCH_TOKENS = 1500
+
+MODEL = "deepseek-chat"
+# 修改提示词时递增，使旧的缓存译文失效
+PROMPT_VERSION = 2
+TEMPERATURE = 0.3
+MAX_TOKENS = 4000
+
+LANG_NAMES = {"en": "英语", "fr": "法语"}
+
+# 批量翻译时每段译文前的分隔标记
+BATCH_MARKER = "<<<P{}>>>"
+# 用户消息中原文之前的标题行，之前是术语表等随请求变化的内容
+SOURCE_HEADER = "原文："
+# 每个请求翻译的术语数
+GLOSSARY_CHUNK = 100
+TERM_LINE_PATTERN = re.compile(r'^\D*?(\d+)[.、]\s*(.+?)\s*$')
+# 译文被截断时按这些位置把原文一分为二重新翻译：先按行，再按句末标点，最后按空白
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?;:。！？；…])\s+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+BATCH_MARKER_PATTERN = re.compile(r'^[ \t]*<<<P(\d+)>>>[ \t]*$', re.MULTILINE)
+
+# 中断后最多等待进行中的请求多少秒
+DRAIN_TIMEOUT = 60
 
 # 全局变量用于保存进度
 progress_file = None
-current_progress = {}
+current_journal = None
+current_writer = None
+
+# 未显式传入客户端时共享的默认客户端
+_default_client = None
+_default_client_lock = threading.Lock()
+
+class ShutdownRequested(KeyboardInterrupt):
+    """收到 SIGINT 或 SIGTERM"""
 
 def signal_handler(signum, frame):
-    """处理中断信号，保存进度后退出"""
-    print("\n收到中断信号，正在保存翻译进度...")
-    save_progress()
-    print("进度已保存，程序退出")
-    sys.exit(0)
+    """处理中断信号：只抛出异常，不做 I/O
+
+    取消尚未开始的请求、等待进行中的请求和保存进度都由翻译循环在信号处理函数之外完成。
+    """
+    raise ShutdownRequested(signum)
+
+def install_signal_handlers():
+    # 只有主线程可以设置信号处理函数
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+def drain(executor, futures, handle, timeout=DRAIN_TIMEOUT):
+    """中断后取消尚未开始的请求，等待进行中的请求完成并交给 handle 记录；再次中断或超时则不再等待"""
+    executor.shutdown(wait=False, cancel_futures=True)
+    remaining = [future for future in futures if not future.cancelled()]
+    if not remaining:
+        return
+    print(f"\n已取消尚未开始的请求，等待 {len(remaining)} 个进行中的请求完成（再按一次 Ctrl+C 立即退出）...")
+    try:
+        for future in as_completed(remaining, timeout=timeout):
+            handle(future)
+    except KeyboardInterrupt:
+        print("不再等待进行中的请求")
+    except FutureTimeoutError:
+        print(f"进行中的请求 {timeout} 秒内没有完成，不再等待")
 
 def save_progress():
-    """保存翻译进度到文件"""
-    if progress_file and current_progress:
-        with open(progress_file, 'w', encoding='utf-8') as f:
-            json.dump(current_progress, f, ensure_ascii=False, indent=2)
+    """确保已完成的译文全部写入进度日志（后台写入线程写完队列并落盘）"""
+    if current_writer is not None:
+        current_writer.close()
         print(f"翻译进度已保存到: {progress_file}")
 
 def load_progress(progress_file):
-    """从文件加载翻译进度"""
-    if os.path.exists(progress_file):
-        try:
-            with open(progress_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"加载进度文件失败: {e}")
-    return {"translated_paragraphs": [], "total_paragraphs": 0, "source_lang": "", "api_key": ""}
+    """从进度日志加载翻译进度
+
+    返回的 translated 记录 {段落索引: 译文}，hashes 记录对应原文的哈希，
+    flags 记录质量检查标记的段落 {段落索引: 问题列表}，accepted 记录用户已接受、不再检查的段落。
+    如果只有旧版的 *_progress.json，则按旧格式读取，此时 hashes 为 None。
+    """
+    progress = {"translated": {}, "hashes": None, "flags": {}, "accepted": set(), "total_paragraphs": 0,
+                "source_lang": ""}
+    legacy_file = legacy_path(progress_file)
+    try:
+        if os.path.exists(progress_file):
+            header, entries = read_journal(progress_file)
+            progress["translated"] = {i: record["t"] for i, record in entries.items()}
+            progress["hashes"] = {i: record["h"] for i, record in entries.items()}
+            progress["flags"] = {i: record["q"] for i, record in entries.items() if record.get("q")}
+            progress["accepted"] = {i for i, record in entries.items() if record.get("a")}
+            progress["total_paragraphs"] = header.get("total_paragraphs", 0)
+            progress["source_lang"] = header.get("source_lang", "")
+        elif os.path.exists(legacy_file):
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            if "translated" in legacy:
+                translated = {int(i): text for i, text in legacy["translated"].items()}
+            else:
+                # 更早的格式：translated_paragraphs 是按顺序完成的前缀列表
+                translated = dict(enumerate(legacy.get("translated_paragraphs", [])))
+            progress["translated"] = translated
+            progress["total_paragraphs"] = legacy.get("total_paragraphs", 0)
+            progress["source_lang"] = legacy.get("source_lang", "")
+    except Exception as e:
+        print(f"加载进度文件失败: {e}")
+    return progress
+
+def resumable_translations(progress, paragraphs, source_lang):
+    """从已有进度中挑出仍然对应当前原文的译文"""
+    if progress["source_lang"] != source_lang:
+        return {}
+    if progress["hashes"] is None:
+        # 旧格式没有原文哈希，只能要求段落总数一致
+        if progress["total_paragraphs"] != len(paragraphs):
+            return {}
+        return {i: text for i, text in progress["translated"].items() if i < len(paragraphs)}
+    return {i: text for i, text in progress["translated"].items()
+            if i < len(paragraphs) and progress["hashes"][i] == paragraph_hash(paragraphs[i])}
+
+def resumed_quality(progress, translated):
+    """可复用的译文上已有的质量标记，返回 ({段落索引: 问题列表}, 已接受的段落索引集合)"""
+    flags = {i: reasons for i, reasons in progress["flags"].items() if i in translated}
+    accepted = {i for i in progress["accepted"] if i in translated}
+    return flags, accepted
+
+def flag_translations(paragraphs, translated, hashes, writer, stats=None, label="", previous=None, accepted=()):
+    """检查全部译文，把有问题的译文连同问题重新写入进度日志，返回 {段落索引: 问题列表}
+
+    previous 为进度日志中已有的标记：检查不再通过的段落去掉标记重写，否则进度文件永远不会被删除。
+    accepted 中的段落（用户已接受的译文）不检查。
+    """
+    flags = check_translations(paragraphs, translated, skip=accepted)
+    for i, reasons in flags.items():
+        writer.append(i, hashes[i], translated[i], reasons)
+    for i in previous or ():
+        if i not in flags:
+            writer.append(i, hashes[i], translated[i])
+    if stats is not None:
+        stats.record_quality(flags)
+    if flags:
+        print(f"{label}质量检查：{len(flags)} 段译文可疑（{describe(flags)}），已在进度文件中标记，"
+              f"可用 --retranslate-flagged 只重新翻译这些段落，或用 quality.py --accept 接受译文")
+    return flags
+
+def flagged_paragraphs(journal):
+    """进度日志中被质量检查标记的段落索引"""
+    return sorted(i for i, record in journal.entries.items() if record.get("q"))
 
 def read_markdown(file_path):
     if not os.path.exists(file_path):
@@ -42,133 +181,517 @@ def read_markdown(file_path):
         return f.read()
 
 def split_paragraphs(md_content):
-    # 按双换行分段
-    return [p.strip() for p in md_content.split('\n\n') if p.strip()]
+    # 按空行分段
+    return list(iter_paragraphs(md_content.split('\n')))
 
-def translate(text, api_key, source_lang):
-    # 使用DeepSeek Chat API进行翻译
-    url = "https://api.deepseek.com/v1/chat/completions"
-    
-    # 构建翻译提示
-    lang_map = {"en": "英语", "fr": "法语"}
-    source_lang_name = lang_map.get(source_lang, source_lang)
-    
-    prompt = f"""请将以下{source_lang_name}文本翻译成中文，保持原文的格式和结构：
+def get_client(api_key):
+    """返回共享的默认客户端，复用同一个连接池"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = DeepSeekClient(api_key)
+        return _default_client
 
-{text}
+def chat_completion(prompt, client, source_lang):
+    """发送单轮对话请求，返回模型回复文本
 
-请只返回翻译结果，不要添加任何解释。"""
-    
+    系统消息对同一源语言的所有请求都相同，服务端的前缀缓存可以命中，重复的提示词 token 按缓存价格计费。
+    """
     payload = {
-        "model": "deepseek-chat",
+        "model": MODEL,
         "messages": [
+            {
+                "role": "system",
+                "content": system_prompt(source_lang)
+            },
             {
                 "role": "user",
                 "content": prompt
             }
         ],
-        "temperature": 0.3,
-        "max_tokens": 4000
-    }
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS
     }
     
+    result = client.chat(payload)
+    try:
+        choice = result['choices'][0]
+        content = choice['message']['content'].strip()
+    except (KeyError, IndexError, TypeError) as e:
+        raise TranslationError(f"响应格式异常: {e}")
+    if choice.get('finish_reason') == 'length':
+        raise TruncatedResponse(f"译文超过 max_tokens={MAX_TOKENS} 被截断")
+    return content
+
+def system_prompt(source_lang):
+    """所有翻译请求共用的系统消息，只随源语言变化"""
+    source_lang_name = LANG_NAMES.get(source_lang, source_lang)
+    return f"""你是专业的{source_lang_name}译中文译者。请将用户消息中"{SOURCE_HEADER}"之后的{source_lang_name}文本翻译成中文，保持原文的格式和结构。
+如果用户消息中有术语表，其中的术语必须按术语表翻译。
+如果原文每段前有一行 {BATCH_MARKER.format("编号")} 形式的标记，请逐段翻译，每段译文前原样保留对应的标记，不要合并、拆分或遗漏段落。
+请只返回翻译结果，不要添加任何解释。"""
+
+def user_prompt(body, glossary=(), note=None):
+    """用户消息：术语表和说明在前，原文在最后"""
+    parts = []
+    if glossary:
+        parts.append("术语表：\n" + '\n'.join(f"{term} => {translation}" for term, translation in glossary))
+    if note:
+        parts.append(note)
+    parts.append(f"{SOURCE_HEADER}\n{body}")
+    return '\n\n'.join(parts)
+
+def single_prompt(text, glossary=()):
+    """构建单段翻译提示"""
+    return user_prompt(text, glossary)
+
+def batch_prompt(texts, glossary=()):
+    """构建多段批量翻译提示，每段前带分隔标记"""
+    body = '\n\n'.join(f"{BATCH_MARKER.format(n)}\n{text}" for n, text in enumerate(texts, 1))
+    return user_prompt(body, glossary, note=f"原文共 {len(texts)} 段。")
+
+def cache_key(text, source_lang, glossary=()):
+    """译文缓存键，提示词、模型参数或用到的术语变化后旧缓存自动失效"""
+    return make_key(text, source_lang, MODEL, PROMPT_VERSION, TEMPERATURE, glossary)
+
+def translate(text, api_key, source_lang, client=None, cache=None, glossary=None):
+    """使用DeepSeek Chat API进行翻译，先查缓存，重试耗尽时抛出 TranslationError"""
+    return translate_batch([text], api_key, source_lang, client, cache, glossary)[0]
+
+def translate_terms(terms, source_lang, client):
+    """翻译术语表中的专有名词，返回 {术语: 译名}；某一批失败或对不上编号的术语被跳过"""
+    translations = {}
+    for start in range(0, len(terms), GLOSSARY_CHUNK):
+        chunk = terms[start:start + GLOSSARY_CHUNK]
+        body = '\n'.join(f"{n}. {term}" for n, term in enumerate(chunk, 1))
+        note = "以下是本书中反复出现的专有名词（人名、地名、组织名等），请逐行给出通行的中文译名，保留行首编号。"
+        try:
+            content = chat_completion(user_prompt(body, note=note), client, source_lang)
+        except TranslationError as e:
+            print(f"{len(chunk)} 个术语翻译失败: {e}")
+            continue
+        for line in content.split('\n'):
+            match = TERM_LINE_PATTERN.match(line)
+            if match and 1 <= int(match.group(1)) <= len(chunk):
+                translations[chunk[int(match.group(1)) - 1]] = match.group(2)
+    return translations
+
+def prepare_glossary(paragraphs, source_lang, path, client, min_count=DEFAULT_MIN_COUNT):
+    """从原文提取专有名词，翻译术语表中还没有的部分并保存，返回 Glossary"""
+    existing = Glossary.load(path)
+    candidates = [term for term, _ in extract_terms(paragraphs, min_count)]
+    new_terms = [term for term in candidates if term not in existing.terms]
+    if new_terms:
+        print(f"术语表: 发现 {len(new_terms)} 个新的专有名词，正在翻译...")
+        save_glossary(path, translate_terms(new_terms, source_lang, client), source_lang)
+    glossary = Glossary.load(path)
+    print(f"术语表: {path}，共 {len(glossary)} 条")
+    return glossary
+
+def split_batch_response(content, count):
+    """按分隔标记拆分批量译文，标记数量或顺序不符时返回 None"""
+    parts = BATCH_MARKER_PATTERN.split(content)
+    # split 结果为 [标记前的内容, 编号1, 译文1, 编号2, 译文2, ...]
+    numbers = parts[1::2]
+    if parts[0].strip() or numbers != [str(n) for n in range(1, count + 1)]:
+        return None
+    texts = [text.strip() for text in parts[2::2]]
+    if not all(texts):
+        return None
+    return texts
+
+def split_in_half(text):
+    """在最接近中点的行、句子或空白边界把文本分成两半，返回 (前半, 分隔符, 后半)，无法拆分时返回 None
+
+    在行边界拆分时原样保留换行，合并单元（merge/reduce 的输出）中段落之间的空行不会丢失。
+    """
+    middle = len(text) // 2
+    for pattern, keep_separator in ((re.compile(r'\n+'), True), (SENTENCE_END_PATTERN, False),
+                                    (WHITESPACE_PATTERN, False)):
+        boundaries = [m for m in pattern.finditer(text) if 0 < m.start() and m.end() < len(text)]
+        if boundaries:
+            best = min(boundaries, key=lambda m: abs(m.start() - middle))
+            return text[:best.start()], best.group() if keep_separator else '', text[best.end():]
+    return None
+
+def translate_long(text, source_lang, client, glossary=None):
+    """翻译单个段落；译文被截断时把原文对半拆开分别翻译再拼接"""
+    entries = glossary.relevant([text]) if glossary else ()
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        if response.status_code == 200:
-            result = response.json()
-            return result['choices'][0]['message']['content'].strip()
+        return chat_completion(single_prompt(text, entries), client, source_lang)
+    except TruncatedResponse:
+        parts = split_in_half(text)
+        if parts is None:
+            raise
+        first, separator, second = parts
+        print(f"译文被截断，把 {len(text)} 字符的段落拆成两部分重新翻译")
+        return (translate_long(first, source_lang, client, glossary) + separator +
+                translate_long(second, source_lang, client, glossary))
+
+def translate_batch(texts, api_key, source_lang, client=None, cache=None, glossary=None):
+    """把多个段落放进一个请求翻译，译文段数对不上时退回逐段翻译
+
+    已在缓存中的段落不会发给 API，新得到的译文写回缓存。
+    传入 glossary（术语表）时，只把这些段落中出现的术语条目附在提示词里。
+    """
+    results = [None] * len(texts)
+    entries = [glossary.relevant([text]) if glossary else () for text in texts]
+    if cache is not None:
+        results = [cache.get(cache_key(text, source_lang, entry)) for text, entry in zip(texts, entries)]
+    missing = [n for n, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+    
+    client = client or get_client(api_key)
+    
+    translated = None
+    if len(missing) > 1:
+        batch_entries = sorted(set().union(*(entries[n] for n in missing)))
+        prompt = batch_prompt([texts[n] for n in missing], batch_entries)
+        try:
+            translated = split_batch_response(chat_completion(prompt, client, source_lang), len(missing))
+        except TruncatedResponse:
+            print(f"{len(missing)} 段的批量译文被截断，改为逐段翻译")
         else:
-            print(f"翻译失败: {response.status_code} - {response.text}")
-            return text
-    except Exception as e:
-        print(f"翻译请求异常: {e}")
-        return text
+            if translated is None:
+                print(f"批量译文段数与原文 {len(missing)} 段不一致，改为逐段翻译")
+    if translated is None:
+        translated = [translate_long(texts[n], source_lang, client, glossary) for n in missing]
+    
+    for n, text in zip(missing, translated):
+        results[n] = text
+        if cache is not None:
+            cache.put(cache_key(texts[n], source_lang, entries[n]), text)
+    return results
+
+def batch_paragraphs(paragraphs, indices, token_budget, skipped=()):
+    """把待翻译的段落索引按 token 预算打包，每批只包含连续的段落
+
+    skipped 中的段落（去重后不需要翻译的重复段落）不打断连续性。
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for i in indices:
+        tokens = estimate_tokens(paragraphs[i])
+        if current and (token_budget <= 0 or
+                        any(gap not in skipped for gap in range(current[-1] + 1, i)) or
+                        current_tokens + tokens > token_budget):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def start_journal(paragraphs, source_lang, progress_file, translated, flags=None, accepted=()):
+    """以可复用的译文开始写进度日志，返回 (进度日志, 各段原文哈希)
+
+    flags 为这些译文上已有的质量标记，accepted 为用户已接受的译文，中断后再次运行时仍然有效。
+    """
+    hashes = [paragraph_hash(p) for p in paragraphs]
+    flags = flags or {}
+    journal = ProgressJournal(progress_file)
+    entries = {}
+    for i, text in translated.items():
+        entries[i] = {"i": i, "h": hashes[i], "t": text}
+        if i in flags:
+            entries[i]["q"] = flags[i]
+        if i in accepted:
+            entries[i]["a"] = True
+    journal.start(len(paragraphs), source_lang, entries, source_hash(hashes))
+    # 旧版进度文件的内容已写入新日志（或被放弃），删除它，避免之后再次恢复过时的译文或留下 API 密钥
+    legacy_file = legacy_path(progress_file)
+    if os.path.exists(legacy_file):
+        os.remove(legacy_file)
+        print(f"已把旧版进度文件 {legacy_file} 迁移到 {progress_file}")
+    return journal, hashes
+
+def run_batch(texts, api_key, source_lang, client, cache, stats, submitted, glossary=None):
+    """在工作线程中翻译一个批次，并记录它在线程池中排队等待的时间"""
+    stats.record_queue_wait(time.monotonic() - submitted)
+    return translate_batch(texts, api_key, source_lang, client, cache, glossary)
+
+def paragraphs_translate(paragraphs, api_key, source_lang, progress_file, concurrency=DEFAULT_CONCURRENCY,
+                         client=None, batch_tokens=DEFAULT_BATCH_TOKENS, cache=None, stats=None, resume=None,
+                         dedup=None, glossary=None, retranslate_flagged=False):
+    """并发翻译段落，支持进度保存和恢复
 
-def paragraphs_translate(paragraphs, api_key, source_lang, progress_file):
-    """翻译段落，支持进度保存和恢复"""
-    global current_progress
+    连续的短段落按 batch_tokens 打包成一个请求，最多同时有 concurrency 个请求在进行中，
+    译文按原段落顺序返回。传入 cache 时已缓存的段落直接复用，不再请求 API。
+    翻译失败的段落暂时保留原文（重新翻译的段落保留之前的译文），且不计入进度，下次运行时会重新翻译。
+    stats 用于统计吞吐量并估算剩余时间，省略时只在本次调用内统计。
+    resume 为 None 时发现已有进度会询问是否继续，为 True/False 时直接继续/重新开始。
+    dedup 为相似度阈值时，重复段落（见 dedup.py）每组只翻译一段，译文分发给组内其他段落。
+    glossary 为术语表（见 glossary.py）时，每个请求附带其原文中出现的术语译名。
+    翻译结束后检查全部译文（见 quality.py），可疑的段落在进度日志中标记。
+    retranslate_flagged 为 True 时直接继续已有进度，只重新翻译被标记的段落和失败的段落：
+    逐段请求，并且不从缓存中取回旧译文；新译文成功之前保留原来的译文。
+    """
+    global current_journal, current_writer
     
-    # 加载已有进度
+    # 加载已有进度，只复用原文未变化的段落
     progress = load_progress(progress_file)
-    translated_paragraphs = progress.get("translated_paragraphs", [])
+    translated = resumable_translations(progress, paragraphs, source_lang)
+    if retranslate_flagged:
+        resume = True
+        batch_tokens = 0
+        cache = RefreshCache(cache) if cache is not None else None
     
     # 检查是否可以继续之前的进度
-    if (len(translated_paragraphs) > 0 and 
-        progress.get("total_paragraphs") == len(paragraphs) and
-        progress.get("source_lang") == source_lang):
-        
-        print(f"发现已有翻译进度，已翻译 {len(translated_paragraphs)}/{len(paragraphs)} 段落")
-        choice = input("是否继续之前的翻译进度？(y/n): ").lower().strip()
-        if choice != 'y':
-            translated_paragraphs = []
-            progress = {"translated_paragraphs": [], "total_paragraphs": len(paragraphs), 
-                       "source_lang": source_lang, "api_key": api_key}
-    else:
-        # 开始新的翻译
-        translated_paragraphs = []
-        progress = {"translated_paragraphs": [], "total_paragraphs": len(paragraphs), 
-                   "source_lang": source_lang, "api_key": api_key}
+    if translated:
+        print(f"发现已有翻译进度，可复用 {len(translated)}/{len(paragraphs)} 段落")
+        if resume is None:
+            resume = input("是否继续之前的翻译进度？(y/n): ").lower().strip() == 'y'
+        if not resume:
+            translated = {}
     
-    current_progress = progress
+    flags, accepted = resumed_quality(progress, translated)
+    retranslate = set(flags) if retranslate_flagged else set()
+    if retranslate_flagged:
+        print(f"重新翻译被标记的 {len(retranslate)} 段和未完成的 {len(paragraphs) - len(translated)} 段")
+    current_journal, hashes = start_journal(paragraphs, source_lang, progress_file, translated, flags, accepted)
+    # 进度在后台线程中写入，不阻塞处理翻译结果
+    current_writer = writer = CheckpointWriter(current_journal)
     
     # 设置中断信号处理
-    signal.signal(signal.SIGINT, signal_handler)
+    install_signal_handlers()
     
     total = len(paragraphs)
-    start_index = len(translated_paragraphs)
+    pending = [i for i in range(total) if i not in translated or i in retranslate]
+    plan = None
+    if dedup is not None:
+        plan = DedupPlan(paragraphs, pending, dedup)
+        batches = batch_paragraphs(paragraphs, plan.representatives, batch_tokens, plan.skipped())
+    else:
+        batches = batch_paragraphs(paragraphs, pending, batch_tokens)
+    failed = []
+    concurrency = max(1, concurrency)
+    stats = stats or RunStats()
+    stats.set_total(total, len(translated) - len(retranslate))
     
-    print(f"开始翻译，从第 {start_index + 1} 段开始...")
+    if plan is not None and plan.duplicates:
+        requests_saved = len(batch_paragraphs(paragraphs, pending, batch_tokens)) - len(batches)
+        stats.record_dedup(plan.duplicates, requests_saved)
+        print(f"去重：{len(pending)} 段中有 {plan.duplicates} 段重复（完全相同 {plan.counts['exact']}，"
+              f"只有数字不同 {plan.counts['numbers']}，近似 {plan.counts['near']}），"
+              f"复用代表段落的译文，省去约 {requests_saved} 个请求")
+    print(f"开始翻译，剩余 {len(pending)} 段，打包为 {len(batches)} 个请求，并发数 {concurrency}...")
     
-    for i in range(start_index, total):
-        print(f"翻译进度: {i + 1}/{total} ({(i + 1) * 100 // total}%)")
-        
-        translated_text = translate(paragraphs[i], api_key, source_lang)
-        translated_paragraphs.append(translated_text)
-        
-        # 更新进度
-        current_progress["translated_paragraphs"] = translated_paragraphs
+    def record(future, batch):
+        """记录一个完成的批次，返回需要单独翻译的重复段落"""
+        label = f"第 {batch[0] + 1} 段" if len(batch) == 1 else f"第 {batch[0] + 1}-{batch[-1] + 1} 段"
+        try:
+            results = future.result()
+        except TranslationError as e:
+            failed.extend(batch)
+            if plan is not None:
+                failed.extend(m for i in batch for m in plan.members.get(i, ()))
+            print(f"{label}翻译失败: {e}")
+            return []
+        finished = list(zip(batch, results))
+        unresolved = []
+        if plan is not None:
+            for i, text in zip(batch, results):
+                resolved, members = plan.fan_out(i, text)
+                finished.extend(resolved)
+                unresolved.extend(members)
+        for i, text in finished:
+            translated[i] = text
+            writer.append(i, hashes[i], text)
         
-        # 每翻译10段保存一次进度
-        if (i + 1) % 10 == 0:
-            save_progress()
-            print(f"已保存进度到第 {i + 1} 段")
-    
-    # 翻译完成，保存最终进度
-    save_progress()
-    print("翻译完成！")
-    
-    return translated_paragraphs
-
-def md_to_epub(translated_md, output_path, title="翻译电子书"):
-    html_content = markdown.markdown(translated_md)
-    book = epub.EpubBook()
-    book.set_title(title)
-    chapter = epub.EpubHtml(title='章节1', file_name='chap_01.xhtml', content=html_content)
-    book.add_item(chapter)
-    book.spine = ['nav', chapter]
-    epub.write_epub(output_path, book, {})
-
-def main():
-    if len(sys.argv) < 5:
-        print("用法: python translate_md_to_epub.py <input.md> <output.epub> <api_key> <source_lang: en|fr>")
-        print("或者设置环境变量 DEEPSEEK_API_KEY")
-        sys.exit(1)
+        stats.record_paragraphs(len(finished))
+        print(f"翻译进度: {stats.progress_line()} - {label}完成")
+        return unresolved
     
-    input_md = sys.argv[1]
-    output_epub = sys.argv[2]
-    api_key = sys.argv[3]
-    source_lang = sys.argv[4]
+    # 译文只在主线程中写入 translated，工作线程只负责请求
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = {}
+    try:
+        # 去重时，数字无法对应到代表段落译文的重复段落在下一轮单独翻译
+        while batches:
+            futures = {executor.submit(run_batch, [paragraphs[i] for i in batch],
+                                       api_key, source_lang, client, cache, stats, time.monotonic(),
+                                       glossary): batch
+                       for batch in batches}
+            retry = []
+            for future in as_completed(futures):
+                retry.extend(record(future, futures[future]))
+                # 记录完成后才移出，中断时 drain 只处理尚未记录的批次
+                del futures[future]
+            batches = batch_paragraphs(paragraphs, sorted(retry), batch_tokens)
+            if retry:
+                stats.record_dedup(-len(retry), -len(batches), len(retry))
+                print(f"{len(retry)} 段重复段落的数字无法从代表段落的译文中对应，改为单独翻译")
+        flag_translations(paragraphs, translated, hashes, writer, stats, previous=flags, accepted=accepted)
+    except KeyboardInterrupt:
+        drain(executor, futures, lambda future: record(future, futures[future]))
+        raise
+    finally:
+        # 中断时取消尚未开始的请求，不等待整本书跑完
+        executor.shutdown(wait=False, cancel_futures=True)
+        # 最终检查点：写完队列中的译文，fsync 并更新索引
+        writer.close()
     
-    # 如果API密钥以<开头，尝试从环境变量获取
-    if api_key.startswith('<') and api_key.endswith('>'):
+    if failed:
+        print(f"翻译结束，但有 {len(failed)} 段失败并保留了原文或之前的译文，重新运行即可只翻译这些段落")
+    else:
+        print("翻译完成！")
+    
+    return [translated.get(i, paragraphs[i]) for i in range(total)]
+
+def md_to_epub(translated_md, output_path, title="翻译电子书", chapter_level=DEFAULT_CHAPTER_LEVEL, workers=None,
+               use_cache=True):
+    """生成EPUB：按标题分章，逐章转换并写入，translated_md 可以是整篇文本或段落列表
+
+    use_cache 为 True 时复用上次生成的未变化章节（缓存在 <输出文件名>_epub_cache 目录）
+    """
+    if isinstance(translated_md, str):
+        translated_md = iter_paragraphs(translated_md.split('\n'))
+    cache_dir = chapter_cache_dir(output_path) if use_cache else None
+    return build_epub(translated_md, output_path, title=title, chapter_level=chapter_level, workers=workers,
+                      cache_dir=cache_dir)
+
+def positive_float(value):
+    """argparse 类型：大于 0 的数"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"应为数字: {value}")
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"应大于 0: {value}")
+    return number
+
+def add_translation_arguments(parser):
+    """添加翻译相关的命令行参数，供本脚本和 pipeline.py 共用"""
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"同时进行的翻译请求数 (默认: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--batch-tokens", type=int, default=DEFAULT_BATCH_TOKENS,
+                        help=f"每个请求最多打包的原文 token 数，0 表示逐段翻译 (默认: {DEFAULT_BATCH_TOKENS})")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help=f"译文缓存文件 (默认: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--no-cache", action="store_true", help="不使用译文缓存")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_MB,
+                        help=f"缓存大小上限，超出后淘汰最久未使用的译文 (默认: {DEFAULT_CACHE_MAX_MB})")
+    parser.add_argument("--dedup", action="store_true",
+                        help="重复段落（页眉、页码、版权声明等）每组只翻译一段，译文分发给其他段落")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_DEDUP_THRESHOLD,
+                        help="--dedup 合并近似段落的相似度阈值，小于 1（如 0.9）时 200 字符以内的近似段落也共用译文 "
+                             f"(默认: {DEFAULT_DEDUP_THRESHOLD:g}，只合并完全相同和只有数字不同的段落)")
+    parser.add_argument("--glossary", action="store_true",
+                        help="提取反复出现的专有名词，翻译一次后保存为 <输入文件名>_glossary.json（可手工修改），"
+                             "每个请求附带其中出现的术语，保证全书译名一致")
+    parser.add_argument("--glossary-min-count", type=int, default=DEFAULT_MIN_COUNT,
+                        help=f"专有名词至少出现多少次才收入术语表 (默认: {DEFAULT_MIN_COUNT})")
+    parser.add_argument("--retranslate-flagged", action="store_true",
+                        help="继续已有进度，只重新翻译质量检查标记的段落（与原文相同、不是中文、长度比异常、疑似截断）"
+                             "和失败的段落，再重新生成EPUB（只重新转换有变化的章节）")
+    parser.add_argument("--rate-limit", type=positive_float, default=5.0,
+                        help="每秒最多发起的请求数，收到429时自动降速 (默认: 5)")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="单次请求的读取超时秒数 (默认: 120)")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="单次请求失败后的最大重试次数 (默认: 5)")
+    parser.add_argument("--stream", action="store_true",
+                        help="使用 SSE 流式响应，响应停滞超过 --idle-timeout 时提前重试")
+    parser.add_argument("--idle-timeout", type=float, default=30,
+                        help="流式模式下多少秒没有收到新内容视为停滞 (默认: 30)")
+    parser.add_argument("--api-url", default=os.getenv("DEEPSEEK_API_URL", DEFAULT_API_URL),
+                        help="Chat Completions 接口地址，也可用环境变量 DEEPSEEK_API_URL 设置；"
+                             "mock://local?latency=0.05&error_rate=0.01 使用进程内的模拟后端")
+    parser.add_argument("--chapter-level", type=int, default=DEFAULT_CHAPTER_LEVEL,
+                        help=f"生成EPUB时在不高于该级别的Markdown标题处分章 (默认: {DEFAULT_CHAPTER_LEVEL})")
+    parser.add_argument("--epub-workers", type=int,
+                        help="并行转换EPUB章节的进程数 (默认: CPU核数)")
+    parser.add_argument("--no-epub-cache", action="store_true",
+                        help="不复用上次生成的EPUB章节 (默认缓存在 <输出文件名>_epub_cache 目录)")
+    parser.add_argument("--report", help="运行结束后把请求耗时、重试、token 用量和各阶段耗时写入该 JSON 文件")
+
+def dedup_threshold(args):
+    """--dedup 时返回相似度阈值，否则返回 None"""
+    return args.dedup_threshold if args.dedup else None
+
+def open_glossary(args, input_md, paragraphs, client):
+    """--glossary 时准备本书的术语表，否则返回 None"""
+    if not args.glossary:
+        return None
+    return prepare_glossary(paragraphs, args.source_lang, glossary_path(input_md), client,
+                            args.glossary_min_count)
+
+def resolve_api_key(api_key):
+    """如果API密钥写成 <...> 占位符，从环境变量 DEEPSEEK_API_KEY 获取"""
+    if api_key is None or (api_key.startswith('<') and api_key.endswith('>')):
         api_key = os.getenv('DEEPSEEK_API_KEY')
         if not api_key:
             print("错误：请在命令行中直接提供API密钥，或设置环境变量 DEEPSEEK_API_KEY")
             sys.exit(1)
+    return api_key
+
+def create_client(args, api_key, stats=None):
+    """按命令行参数创建 API 客户端，传入 stats 时记录每次请求"""
+    # 模拟后端依赖 requests，与客户端一样只在真正需要发请求时才导入
+    from mock_backend import mock_adapter
+    return DeepSeekClient(api_key, api_url=args.api_url, timeout=(10, args.timeout),
+                          max_retries=args.max_retries, rate_limit=args.rate_limit,
+                          pool_size=args.concurrency, stats=stats,
+                          stream=args.stream, idle_timeout=args.idle_timeout,
+                          transport=mock_adapter(args.api_url))
+
+def open_cache(args):
+    """按命令行参数打开译文缓存，--no-cache 时返回 None"""
+    if args.no_cache:
+        return None
+    print(f"译文缓存: {args.cache}")
+    return TranslationCache(args.cache, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+
+def close_cache(cache):
+    """打印缓存统计并关闭缓存"""
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(f"缓存命中 {stats['hits']} 段，未命中 {stats['misses']} 段，"
+          f"共 {stats['entries']} 条 ({stats['bytes'] / 1024 / 1024:.1f} MB)")
+    cache.close()
+
+def finish_report(stats, report_path):
+    """打印运行摘要，指定了 --report 时写入 JSON 报告"""
+    report = stats.report()
+    requests_info = report["requests"]
+    print(f"共 {requests_info['count']} 次请求，重试 {requests_info['retries']} 次，"
+          f"失败 {requests_info['failures']} 次，消耗 {report['tokens']['total_tokens']} tokens，"
+          f"用时 {format_seconds(report['elapsed_seconds'])}")
+    if report["quality"]["flagged"]:
+        print(f"质量检查标记了 {report['quality']['flagged']} 段可疑译文")
+    dedup = report["dedup"]
+    if dedup["paragraphs_saved"] or dedup["retranslated"]:
+        print(f"去重复用译文 {dedup['paragraphs_saved']} 段，省去约 {dedup['requests_saved']} 个请求，"
+              f"{dedup['retranslated']} 段重复段落改为单独翻译")
+    if report_path:
+        stats.write(report_path)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="使用DeepSeek API翻译Markdown文件并转换为EPUB",
+        epilog="API密钥可写成 <API_KEY> 占位符，此时从环境变量 DEEPSEEK_API_KEY 读取")
+    parser.add_argument("input_md", help="输入的Markdown文件")
+    parser.add_argument("output_epub", help="输出的EPUB文件")
+    parser.add_argument("api_key", help="DeepSeek API密钥")
+    parser.add_argument("source_lang", help="源语言 (en/fr)")
+    parser.add_argument("--clean", action="store_true",
+                        help="翻译前在内存中按 clean_md.py 的规则清理原文，无需生成中间文件")
+    parser.add_argument("--clean-workers", type=int,
+                        help="--clean 时大文件按段落边界分片并行清理的进程数 (默认: CPU核数)")
+    add_translation_arguments(parser)
+    args = parser.parse_args()
+    
+    input_md = args.input_md
+    output_epub = args.output_epub
+    api_key = args.api_key
+    source_lang = args.source_lang
+    
+    api_key = resolve_api_key(api_key)
     
     if source_lang not in ["en", "fr"]:
         print("source_lang 只支持 'en' 或 'fr'")
@@ -176,29 +699,50 @@ def main():
     
     # 设置进度文件路径
     global progress_file
-    progress_file = f"{os.path.splitext(input_md)[0]}_progress.json"
+    progress_file = f"{os.path.splitext(input_md)[0]}_progress.jsonl"
+    if args.retranslate_flagged and not os.path.exists(progress_file):
+        print(f"错误：进度文件 {progress_file} 不存在，没有可以重新翻译的段落")
+        sys.exit(1)
     
     print(f"开始处理文件: {input_md}")
     print(f"输出文件: {output_epub}")
     print(f"进度文件: {progress_file}")
     print(f"源语言: {source_lang}")
+    print(f"并发数: {args.concurrency}")
     
-    md_content = read_markdown(input_md)
-    print(f"文件大小: {len(md_content)} 字符")
+    stats = RunStats()
     
-    paragraphs = split_paragraphs(md_content)
+    # 逐段读取，不把整个文件读成一个字符串
+    with stats.stage("read"):
+        if args.clean:
+            chunks = parallel_clean_chunks(iter_chunks(input_md), args.clean_workers)
+            paragraphs = list(iter_paragraphs(split_lines(chunks)))
+        else:
+            paragraphs = list(read_paragraphs(input_md))
+    print(f"文件大小: {sum(len(p) for p in paragraphs)} 字符（不含段落间空行）")
     print(f"段落数量: {len(paragraphs)}")
     
+    client = create_client(args, api_key, stats)
+    cache = open_cache(args)
+    
     try:
-        translated_paragraphs = paragraphs_translate(paragraphs, api_key, source_lang, progress_file)
-        translated_md = '\n\n'.join(translated_paragraphs)
-        
-        md_to_epub(translated_md, output_epub)
+        with stats.stage("translate"):
+            translated_paragraphs = paragraphs_translate(paragraphs, api_key, source_lang, progress_file,
+                                                         concurrency=args.concurrency, client=client,
+                                                         batch_tokens=args.batch_tokens, cache=cache,
+                                                         stats=stats, dedup=dedup_threshold(args),
+                                                         glossary=open_glossary(args, input_md, paragraphs, client),
+                                                         retranslate_flagged=args.retranslate_flagged)
+        with stats.stage("epub"):
+            md_to_epub(translated_paragraphs, output_epub, chapter_level=args.chapter_level,
+                       workers=args.epub_workers, use_cache=not args.no_epub_cache)
         print(f"转换完成，输出文件: {output_epub}")
         
-        # 翻译完成后删除进度文件
-        if os.path.exists(progress_file):
-            os.remove(progress_file)
+        # 全部段落翻译成功且没有可疑译文时删除进度文件，否则保留以便只重新翻译这些段落
+        if len(current_journal.entries) < len(paragraphs) or flagged_paragraphs(current_journal):
+            print(f"部分段落翻译失败或译文可疑，保留进度文件: {progress_file}")
+        else:
+            remove_journal(progress_file)
             print(f"已删除进度文件: {progress_file}")
             
     except KeyboardInterrupt:
@@ -209,6 +753,10 @@ def main():
         print(f"程序异常: {e}")
         save_progress()
         print("进度已保存")
+    finally:
+        client.close()
+        close_cache(cache)
+        finish_report(stats, args.report)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
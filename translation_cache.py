@@ -0,0 +1,163 @@
+"""
+翻译缓存
+以 (规范化原文, 源语言, 模型, 提示词版本, temperature) 的哈希为键，把译文保存在本地 SQLite 中，
+重新运行或原文只做了小改动时，未变化的段落无需再次请求 API
+"""
+
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+DEFAULT_CACHE_PATH = "translation_cache.sqlite3"
+DEFAULT_CACHE_MAX_MB = 512
+
+HORIZONTAL_SPACE_PATTERN = re.compile(r'[ \t\u00a0\u3000]+')
+
+
+def normalize_text(text):
+    """规范化原文：统一 Unicode 形式并折叠行内空白，避免无意义的差异导致缓存未命中
+
+    换行会影响 Markdown 结构（列表、标题），因此保留。
+    """
+    text = unicodedata.normalize('NFC', text)
+    lines = (HORIZONTAL_SPACE_PATTERN.sub(' ', line).strip() for line in text.strip().split('\n'))
+    return '\n'.join(lines)
+
+
+def make_key(text, source_lang, model, prompt_version, temperature, glossary=()):
+    """计算缓存键，glossary 为提示词中附带的 (术语, 译名) 条目"""
+    fields = [normalize_text(text), source_lang, model, prompt_version, temperature]
+    if glossary:
+        fields.append([list(entry) for entry in glossary])
+    material = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """基于 SQLite 的译文缓存，可在多个线程间共享，超过 max_bytes 时淘汰最久未使用的条目"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # 只用 make_key、normalize_text 的模块（如 dedup）不需要加载 sqlite3
+        import sqlite3
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                translation TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON translations (last_used)")
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+
+    def get(self, key):
+        """查询译文，未命中返回 None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE translations SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                              (time.time(), key))
+            return row[0]
+
+    def put(self, key, translation):
+        """写入译文，必要时淘汰旧条目"""
+        size = len(translation.encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM translations WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO translations (key, translation, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", (key, translation, size, now, now))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                # 一次淘汰到上限的 90%，避免每次写入都触发淘汰
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target_bytes):
+        rows = self.conn.execute("SELECT key, size FROM translations ORDER BY last_used")
+        victims = []
+        for key, size in rows:
+            if self.total_bytes <= target_bytes:
+                break
+            victims.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM translations WHERE key = ?", victims)
+        return len(victims)
+
+    def evict(self, max_bytes):
+        """淘汰最久未使用的条目，直到总大小不超过 max_bytes，返回删除的条目数"""
+        with self.lock:
+            return self._evict(max_bytes)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self.lock:
+            entries, total_hits = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM translations").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": self.total_bytes,
+                "lifetime_hits": total_hits,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class RefreshCache:
+    """只写不读的缓存视图：重新翻译时不取回缓存中有问题的旧译文，得到的新译文覆盖旧条目"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, key):
+        return None
+
+    def put(self, key, translation):
+        self.cache.put(key, translation)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法：python translation_cache.py <缓存文件> [--evict 最大MB]")
+        print(f"示例：python translation_cache.py {DEFAULT_CACHE_PATH} --evict 100")
+        sys.exit(1)
+
+    cache = TranslationCache(sys.argv[1], max_bytes=None)
+    if len(sys.argv) > 3 and sys.argv[2] == "--evict":
+        removed = cache.evict(int(float(sys.argv[3]) * 1024 * 1024))
+        print(f"已淘汰 {removed} 条缓存")
+
+    stats = cache.stats()
+    print(f"缓存文件: {sys.argv[1]}")
+    print(f"- 条目数: {stats['entries']}")
+    print(f"- 译文总大小: {stats['bytes'] / 1024 / 1024:.2f} MB")
+    print(f"- 累计命中次数: {stats['lifetime_hits']}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()